@@ -37,8 +37,7 @@ async def get_all_configs(
 ):
     """获取所有配置"""
     service = SystemConfigService(db)
-    configs = await service.get_all_configs()
-    return configs
+    return [config async for config in service.get_all_configs()]
 
 
 @router.post("/", response_model=SystemConfigResponse, status_code=status.HTTP_201_CREATED)
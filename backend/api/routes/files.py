@@ -1,6 +1,7 @@
 """
 文件管理相关的API路由
 """
+import asyncio
 import os
 import platform
 from pathlib import Path
@@ -8,7 +9,6 @@ from fastapi import APIRouter, HTTPException, status, Query, UploadFile, File, F
 from fastapi.responses import FileResponse
 from typing import List, Optional
 from pydantic import BaseModel
-import aiofiles
 
 router = APIRouter()
 
@@ -42,6 +42,24 @@ class FileSaveRequest(BaseModel):
     encoding: str = "utf-8"
 
 
+def _write_file_bytes(path: str, content: bytes):
+    """写入二进制文件（阻塞操作，在线程中执行）"""
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _read_text_file(path: str, encoding: str) -> str:
+    """读取文本文件（阻塞操作，在线程中执行）"""
+    with open(path, 'r', encoding=encoding) as f:
+        return f.read()
+
+
+def _write_text_file(path: str, content: str, encoding: str):
+    """写入文本文件（阻塞操作，在线程中执行）"""
+    with open(path, 'w', encoding=encoding) as f:
+        f.write(content)
+
+
 def get_home_directory() -> str:
     """获取基础目录（Windows上返回根目录，其他系统返回用户主目录）"""
     if platform.system() == "Windows":
@@ -263,9 +281,8 @@ async def upload_file(
             )
         
         # 保存文件
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        content = await file.read()
+        await asyncio.to_thread(_write_file_bytes, file_path, content)
         
         return {
             "success": True,
@@ -369,13 +386,11 @@ async def get_file_content(
         
         # 读取文件内容
         try:
-            async with aiofiles.open(path, 'r', encoding=encoding) as f:
-                content = await f.read()
+            content = await asyncio.to_thread(_read_text_file, path, encoding)
         except UnicodeDecodeError:
             # 如果指定编码失败，尝试utf-8
             try:
-                async with aiofiles.open(path, 'r', encoding='utf-8') as f:
-                    content = await f.read()
+                content = await asyncio.to_thread(_read_text_file, path, 'utf-8')
                 encoding = 'utf-8'
             except UnicodeDecodeError:
                 raise HTTPException(
@@ -430,8 +445,7 @@ async def save_file_content(
         
         # 保存文件内容
         try:
-            async with aiofiles.open(path, 'w', encoding=request.encoding) as f:
-                await f.write(request.content)
+            await asyncio.to_thread(_write_text_file, path, request.content, request.encoding)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
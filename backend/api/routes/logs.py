@@ -8,6 +8,7 @@ from typing import List
 from core.database import get_db
 from services.log_service import LogService
 from services.task_service import TaskService
+from models.task import TaskStatus
 from schemas.log import TaskLogResponse, LogContentResponse, TaskLogListResponse
 
 router = APIRouter()
@@ -19,13 +20,13 @@ async def get_running_tasks_logs(
 ):
     """获取所有正在运行任务的最新日志内容"""
     task_service = TaskService(db)
-    running_tasks = await task_service.get_running_tasks()
+    running_tasks = await task_service.get_tasks_with_logs(limit=None, status=TaskStatus.RUNNING)
     
     log_service = LogService(db)
     result = {}
     
     for task in running_tasks:
-        logs = await log_service.get_task_logs(task.id)
+        logs = task.logs
         if logs:
             # 获取最新日志的内容
             latest_log = logs[0]
@@ -52,13 +53,12 @@ async def get_all_running_task_logs(
 ):
     """获取所有正在运行任务的最新日志"""
     task_service = TaskService(db)
-    running_tasks = await task_service.get_running_tasks()
+    running_tasks = await task_service.get_tasks_with_logs(limit=None, status=TaskStatus.RUNNING)
     
-    log_service = LogService(db)
     all_logs = []
     
     for task in running_tasks:
-        logs = await log_service.get_task_logs(task.id)
+        logs = task.logs
         if logs:
             # 只取最新的日志
             all_logs.append(logs[0])
@@ -38,8 +38,7 @@ async def get_tasks(
 ):
     """获取任务列表"""
     service = TaskService(db)
-    tasks = await service.get_tasks(skip=skip, limit=limit)
-    total = await service.get_tasks_count()
+    tasks, total = await service.get_tasks_page(skip=skip, limit=limit)
     
     return TaskListResponse(tasks=tasks, total=total)
 
@@ -90,7 +89,7 @@ async def update_task(
         )
     
     # 如果任务状态是失败、完成或停止，且用户没有明确设置状态，则重置为等待中
-    if (current_task.status in [TaskStatus.FAILED, TaskStatus.COMPLETED, TaskStatus.STOPPED] 
+    if (current_task.status in [TaskStatus.FAILED.value, TaskStatus.COMPLETED.value, TaskStatus.STOPPED.value] 
         and task_data.status is None):
         task_data.status = TaskStatus.PENDING
         logger.info(f"任务 {task_id} 状态从 {current_task.status} 重置为 PENDING")
@@ -146,7 +145,7 @@ async def start_task(
     
     logger.info(f"API: 任务 {task_id} 当前状态: {task.status}")
     
-    if task.status == TaskStatus.RUNNING:
+    if task.status == TaskStatus.RUNNING.value:
         logger.info(f"API: 任务 {task_id} 已在运行中")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -190,7 +189,7 @@ async def stop_task(
             detail="任务不存在"
         )
     
-    if task.status != TaskStatus.RUNNING:
+    if task.status != TaskStatus.RUNNING.value:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="任务未在运行中"
@@ -10,14 +10,16 @@ import json
 from typing import Dict, Set
 
 from core.database import get_db, AsyncSessionLocal
+from core.events import task_events, wait_for_status
 from services.task_service import TaskService
-from services.log_service import LogService
+from services.log_service import LogService, LogStreamDecoder
 
 logger = logging.getLogger(__name__)
 
 # WebSocket日志读取限制配置
 MAX_WEBSOCKET_LINES = 10000  # WebSocket初始读取最大行数
 MAX_FILE_SIZE_MB = 10  # 最大文件大小（MB），超过此大小将只读取最后部分
+STATUS_RECHECK_INTERVAL = 30  # 未收到状态变更事件时，兜底查询数据库中任务状态的间隔（秒）
 
 router = APIRouter()
 
@@ -63,10 +65,19 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+async def _recheck_task_status(db: AsyncSession, task_service: TaskService, task_id: int):
+    """从数据库重新读取任务状态（状态变更事件的兜底检查）"""
+    db.expire_all()
+    task = await task_service.get_task(task_id)
+    return task.status if task else None
+
+
 @router.websocket("/logs/{task_id}")
 async def websocket_logs(websocket: WebSocket, task_id: int):
     """实时日志WebSocket端点"""
     await manager.connect(websocket, task_id)
+    # 订阅任务状态变更事件，代替轮询数据库
+    status_queue = task_events.subscribe(task_id)
     
     try:
         # 获取数据库会话
@@ -85,11 +96,12 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                 return
             
             # 发送初始状态
+            task_status = task.status
             await websocket.send_text(json.dumps({
                 "type": "status_update",
                 "task_id": task_id,
                 "task_name": task.name,
-                "status": task.status.value
+                "status": task.status
             }))
             
             # 获取最新日志文件
@@ -139,9 +151,13 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                 
                 # 监控日志文件变化
                 last_size = os.path.getsize(log_file_path) if os.path.exists(log_file_path) else 0
+                # 增量内容解码器：同一日志文件只探测一次编码，并保留跨两次读取被截断的字符
+                stream_decoder = LogStreamDecoder()
                 
+                last_recheck = asyncio.get_running_loop().time()
                 while True:
-                    await asyncio.sleep(3)  # 每3秒检查一次
+                    # 等待状态变更事件，最多等待3秒后检查日志文件变化
+                    new_status = await wait_for_status(status_queue, 3)
                     
                     # 检查是否有新的日志文件（日志轮转）
                     current_logs = await log_service.get_task_logs(task_id)
@@ -165,6 +181,7 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                             # 切换到新日志文件
                             log_file_path = current_log_path
                             last_size = 0  # 重置文件大小，从头开始读取新文件
+                            stream_decoder = LogStreamDecoder()
                             
                             # 发送新文件的初始内容（限制大小）
                             if os.path.exists(log_file_path):
@@ -220,14 +237,18 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                                     logger.warning(f"任务 {task_id} 日志增量过大 ({increment_size_mb:.2f}MB)，限制读取")
                                     # 只读取最后部分（约1000行，假设每行100字符）
                                     read_size = min(100 * 1024, increment_size)  # 最多读取100KB
-                                    with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                                    # 以二进制读取：任务输出按原始编码（如GBK）写入，需探测编码后解码
+                                    with open(log_file_path, 'rb') as f:
                                         f.seek(max(0, current_size - read_size))
-                                        new_content = f.read()
-                                        if new_content:
-                                            # 跳过可能不完整的首行
-                                            first_newline = new_content.find('\n')
+                                        new_bytes = f.read(read_size)
+                                        if new_bytes:
+                                            # 跳过可能不完整的首行（按字节处理，首行可能截断了多字节字符）
+                                            first_newline = new_bytes.find(b'\n')
                                             if first_newline > 0:
-                                                new_content = new_content[first_newline + 1:]
+                                                new_bytes = new_bytes[first_newline + 1:]
+                                            # 跳过了中间内容，上次未解码完的字节已不连续
+                                            stream_decoder.reset()
+                                            new_content = stream_decoder.decode(new_bytes)
                                             await websocket.send_text(json.dumps({
                                                 "type": "log_update",
                                                 "task_id": task_id,
@@ -237,15 +258,16 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                                             }))
                                 else:
                                     # 增量正常，正常读取
-                                    with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                                    with open(log_file_path, 'rb') as f:
                                         f.seek(last_size)
-                                        new_content = f.read()
-                                        if new_content:
-                                            await websocket.send_text(json.dumps({
-                                                "type": "log_update",
-                                                "task_id": task_id,
-                                                "content": new_content
-                                            }))
+                                        new_bytes = f.read(increment_size)
+                                    new_content = stream_decoder.decode(new_bytes)
+                                    if new_content:
+                                        await websocket.send_text(json.dumps({
+                                            "type": "log_update",
+                                            "task_id": task_id,
+                                            "content": new_content
+                                        }))
                                 last_size = current_size
                             except Exception as e:
                                 logger.error(f"读取任务 {task_id} 新日志内容失败: {str(e)}")
@@ -255,32 +277,39 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
                                     "message": f"读取新日志内容失败: {str(e)}"
                                 }))
                     
+                    # 没有收到事件时定期查询数据库兜底
+                    now = asyncio.get_running_loop().time()
+                    if new_status is None and now - last_recheck >= STATUS_RECHECK_INTERVAL:
+                        new_status = await _recheck_task_status(db, task_service, task_id)
+                    if new_status is not None:
+                        last_recheck = now
+                    
                     # 检查任务状态变化
-                    updated_task = await task_service.get_task(task_id)
-                    if updated_task and updated_task.status != task.status:
-                        task = updated_task
+                    if new_status and new_status != task_status:
+                        task_status = new_status
                         await websocket.send_text(json.dumps({
                             "type": "status_update",
                             "task_id": task_id,
                             "task_name": task.name,
-                            "status": task.status.value
+                            "status": task_status
                         }))
             else:
-                # 没有日志文件，只监控状态变化
+                # 没有日志文件，只监控状态变化（等待状态变更事件，超时后查询数据库兜底）
                 while True:
-                    await asyncio.sleep(2)
-                    updated_task = await task_service.get_task(task_id)
-                    if updated_task and updated_task.status != task.status:
-                        task = updated_task
+                    new_status = await wait_for_status(status_queue, STATUS_RECHECK_INTERVAL)
+                    if new_status is None:
+                        new_status = await _recheck_task_status(db, task_service, task_id)
+                    if new_status and new_status != task_status:
+                        task_status = new_status
                         await websocket.send_text(json.dumps({
                             "type": "status_update",
                             "task_id": task_id,
                             "task_name": task.name,
-                            "status": task.status.value
+                            "status": task_status
                         }))
                         
                         # 如果任务开始运行，重新获取日志文件
-                        if task.status.value == "running":
+                        if task_status == "running":
                             logs = await log_service.get_task_logs(task_id)
                             if logs:
                                 break
@@ -296,4 +325,6 @@ async def websocket_logs(websocket: WebSocket, task_id: int):
             }))
         except:
             pass
-        manager.disconnect(websocket, task_id)
\ No newline at end of file
+        manager.disconnect(websocket, task_id)
+    finally:
+        task_events.unsubscribe(task_id, status_queue)
\ No newline at end of file
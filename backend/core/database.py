@@ -3,6 +3,7 @@
 """
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy import text
 import os
 
 # 数据库配置
@@ -25,6 +26,13 @@ AsyncSessionLocal = async_sessionmaker(
 Base = declarative_base()
 
 
+def _create_missing_indexes(sync_conn):
+    """为已存在的表创建模型中定义但数据库中缺失的索引"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def init_db():
     """初始化数据库"""
     # 导入所有模型以确保它们被注册到Base.metadata
@@ -33,6 +41,23 @@ async def init_db():
     async with engine.begin() as conn:
         # 创建所有表
         await conn.run_sync(Base.metadata.create_all)
+        
+        # 兼容旧数据：原Enum列存储的是枚举名（如 RUNNING），统一转换为字符串取值（如 running）
+        await conn.execute(text(
+            "UPDATE tasks SET status = lower(status), repeat_type = lower(repeat_type) "
+            "WHERE status != lower(status) OR repeat_type != lower(repeat_type)"
+        ))
+        
+        # 兼容旧数据库：create_all不会为已存在的表添加新列，这里补充日志轮换元数据列
+        result = await conn.execute(text("PRAGMA table_info(task_logs)"))
+        log_columns = {row[1] for row in result}
+        if "log_date" not in log_columns:
+            await conn.execute(text("ALTER TABLE task_logs ADD COLUMN log_date DATE"))
+        if "part_num" not in log_columns:
+            await conn.execute(text("ALTER TABLE task_logs ADD COLUMN part_num INTEGER NOT NULL DEFAULT 1"))
+        
+        # create_all不会为已存在的表补建索引，这里补建模型中新增的索引
+        await conn.run_sync(_create_missing_indexes)
 
 
 async def get_db():
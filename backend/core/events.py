@@ -0,0 +1,56 @@
+"""
+任务状态变更事件通知（进程内）
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅队列的最大长度，消费过慢时丢弃新事件（订阅方会定期查询数据库兜底）
+MAX_QUEUE_SIZE = 100
+
+
+class TaskEventNotifier:
+    """任务状态变更通知器：状态更新提交后发布 (task_id, status)，订阅方通过asyncio.Queue等待事件"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, task_id: int) -> asyncio.Queue:
+        """订阅指定任务的状态变更事件"""
+        queue = asyncio.Queue(maxsize=MAX_QUEUE_SIZE)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: int, queue: asyncio.Queue):
+        """取消订阅"""
+        queues = self._subscribers.get(task_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[task_id]
+
+    def publish(self, task_id: int, status: str):
+        """发布任务状态变更事件（必须在事件循环线程中调用）"""
+        for queue in self._subscribers.get(task_id, ()):
+            try:
+                queue.put_nowait((task_id, status))
+            except asyncio.QueueFull:
+                logger.warning(f"任务 {task_id} 状态事件队列已满，丢弃事件: {status}")
+
+
+async def wait_for_status(queue: asyncio.Queue, timeout: float) -> Optional[str]:
+    """等待状态变更事件，返回最新状态；超时返回None"""
+    try:
+        _, status = await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    # 一次取完积压的事件，只保留最新状态
+    while not queue.empty():
+        _, status = queue.get_nowait()
+    return status
+
+
+# 全局通知器实例
+task_events = TaskEventNotifier()
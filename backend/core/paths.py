@@ -0,0 +1,11 @@
+"""
+项目路径常量
+"""
+from pathlib import Path
+
+# backend目录的绝对路径
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 任务日志目录（绝对路径）及其相对backend目录的路径
+LOG_DIR = BASE_DIR / "logs"
+LOG_DIR_REL = LOG_DIR.relative_to(BASE_DIR)
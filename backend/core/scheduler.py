@@ -5,15 +5,18 @@ import asyncio
 import subprocess
 import psutil
 import os
+import re
 import sys
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Optional, Set, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.cron import CronTrigger
 
 from core.database import AsyncSessionLocal
+from core.events import task_events
+from core.paths import BASE_DIR, LOG_DIR_REL
 from services.task_service import TaskService
 from services.log_service import LogService
 from services.system_config_service import SystemConfigService
@@ -22,15 +25,27 @@ from models.task import Task, TaskStatus, RepeatType
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 任务日志文件名：task_{task_id}_{task_name}_{date}_{time}[_part{N}].txt
+_TASK_LOG_RE = re.compile(r"^task_(\d+)_.*\.txt$")
+
+
+class TaskRuntime:
+    """运行中任务的进程与日志信息"""
+    __slots__ = ('process', 'log_entry_id', 'log_file', 'existing_paths')
+    
+    def __init__(self, process: Optional[subprocess.Popen] = None, log_entry_id: Optional[int] = None, log_file: Optional[str] = None):
+        self.process = process
+        self.log_entry_id = log_entry_id  # 当前日志条目ID
+        self.log_file = log_file  # 当前日志文件路径
+        self.existing_paths: Set[str] = set()  # 已确认记录在数据库中的日志文件路径
+
 
 class TaskScheduler:
     """任务调度器类"""
     
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
-        self.running_processes: Dict[int, subprocess.Popen] = {}
-        self.task_log_entries: Dict[int, int] = {}  # task_id -> log_entry_id
-        self.task_log_files: Dict[int, str] = {}  # task_id -> current_log_file_path
+        self.tasks: Dict[int, TaskRuntime] = {}  # task_id -> 运行时信息
     
     async def start(self):
         """启动调度器"""
@@ -50,14 +65,14 @@ class TaskScheduler:
     async def stop(self):
         """停止调度器"""
         # 停止所有正在运行的任务
-        for task_id in list(self.running_processes.keys()):
+        for task_id in list(self.tasks.keys()):
             await self.stop_task(task_id)
         
         self.scheduler.shutdown()
     
     async def stop_all_tasks(self) -> dict:
         """停止所有正在运行的任务"""
-        running_task_ids = list(self.running_processes.keys())
+        running_task_ids = list(self.tasks.keys())
         if not running_task_ids:
             return {"success": True, "stopped_count": 0, "message": "没有正在运行的任务"}
         
@@ -96,11 +111,11 @@ class TaskScheduler:
             for task in tasks:
                 try:
                     # 重复任务：无论当前状态都应当被调度
-                    if task.repeat_type != RepeatType.NONE:
+                    if task.repeat_type != RepeatType.NONE.value:
                         await self._schedule_task(task)
                     else:
                         # 一次性任务：仅在状态为等待中且开始时间未过期时调度
-                        if task.status == TaskStatus.PENDING and task.start_time and task.start_time > now:
+                        if task.status == TaskStatus.PENDING.value and task.start_time and task.start_time > now:
                             await self._schedule_task(task)
                 except Exception as e:
                     logger.error(f"调度任务 {task.id} 失败: {str(e)}")
@@ -114,17 +129,17 @@ class TaskScheduler:
             self.scheduler.remove_job(job_id)
         
         # 根据重复类型设置触发器
-        if task.repeat_type == RepeatType.NONE:
+        if task.repeat_type == RepeatType.NONE.value:
             # 一次性任务
             trigger = DateTrigger(run_date=task.start_time)
-        elif task.repeat_type == RepeatType.DAILY:
+        elif task.repeat_type == RepeatType.DAILY.value:
             # 每日重复
             trigger = CronTrigger(
                 hour=task.start_time.hour,
                 minute=task.start_time.minute,
                 second=task.start_time.second
             )
-        elif task.repeat_type == RepeatType.WEEKLY:
+        elif task.repeat_type == RepeatType.WEEKLY.value:
             # 每周重复
             trigger = CronTrigger(
                 day_of_week=task.start_time.weekday(),
@@ -132,7 +147,7 @@ class TaskScheduler:
                 minute=task.start_time.minute,
                 second=task.start_time.second
             )
-        elif task.repeat_type == RepeatType.MONTHLY:
+        elif task.repeat_type == RepeatType.MONTHLY.value:
             # 每月重复
             trigger = CronTrigger(
                 day=task.start_time.day,
@@ -140,7 +155,7 @@ class TaskScheduler:
                 minute=task.start_time.minute,
                 second=task.start_time.second
             )
-        elif task.repeat_type == RepeatType.QUARTERLY:
+        elif task.repeat_type == RepeatType.QUARTERLY.value:
             # 每季度重复（每3个月）
             # 根据起始月份计算每季度的月份列表
             start_month = task.start_time.month
@@ -176,7 +191,7 @@ class TaskScheduler:
                 self.scheduler.remove_job(stop_job_id)
             
             # 根据重复类型设置停止触发器
-            if task.repeat_type == RepeatType.NONE:
+            if task.repeat_type == RepeatType.NONE.value:
                 # 一次性任务：在结束时间点停止
                 if task.end_time > datetime.utcnow():
                     stop_trigger = DateTrigger(run_date=task.end_time)
@@ -187,7 +202,7 @@ class TaskScheduler:
                         id=stop_job_id,
                         replace_existing=True
                     )
-            elif task.repeat_type == RepeatType.DAILY:
+            elif task.repeat_type == RepeatType.DAILY.value:
                 # 每日重复：每天在结束时间停止
                 stop_trigger = CronTrigger(
                     hour=task.end_time.hour,
@@ -201,7 +216,7 @@ class TaskScheduler:
                     id=stop_job_id,
                     replace_existing=True
                 )
-            elif task.repeat_type == RepeatType.WEEKLY:
+            elif task.repeat_type == RepeatType.WEEKLY.value:
                 # 每周重复：每周在结束时间的星期几停止
                 stop_trigger = CronTrigger(
                     day_of_week=task.end_time.weekday(),
@@ -216,7 +231,7 @@ class TaskScheduler:
                     id=stop_job_id,
                     replace_existing=True
                 )
-            elif task.repeat_type == RepeatType.MONTHLY:
+            elif task.repeat_type == RepeatType.MONTHLY.value:
                 # 每月重复：每月在结束时间的日期停止
                 stop_trigger = CronTrigger(
                     day=task.end_time.day,
@@ -231,7 +246,7 @@ class TaskScheduler:
                     id=stop_job_id,
                     replace_existing=True
                 )
-            elif task.repeat_type == RepeatType.QUARTERLY:
+            elif task.repeat_type == RepeatType.QUARTERLY.value:
                 # 每季度重复：每季度在结束时间停止
                 # 根据结束月份计算每季度的月份列表
                 end_month = task.end_time.month
@@ -269,12 +284,12 @@ class TaskScheduler:
             logger.info(f"任务 {task_id} 当前状态: {task.status}")
             
             # 检查任务是否已在运行
-            if task.status == TaskStatus.RUNNING:
+            if task.status == TaskStatus.RUNNING.value:
                 logger.info(f"任务 {task_id} 已在运行中")
                 return
             
             # 检查是否已超过结束日期（对于重复任务，如果结束日期已过，不再执行）
-            if task.end_time and task.repeat_type != RepeatType.NONE:
+            if task.end_time and task.repeat_type != RepeatType.NONE.value:
                 now = datetime.utcnow()
                 start_date = task.start_time.date()
                 end_date = task.end_time.date()
@@ -294,6 +309,7 @@ class TaskScheduler:
                             self.scheduler.remove_job(stop_job_id)
                         return
             
+            runtime: Optional[TaskRuntime] = None
             try:
                 logger.info(f"开始启动任务 {task_id}: {task.name}")
                 
@@ -323,8 +339,8 @@ class TaskScheduler:
                     # 不抛出异常，继续执行，让log_wrapper尝试创建
                 
                 log_entry = await log_service.create_log_entry(task_id, log_file_path)
-                self.task_log_entries[task_id] = log_entry.id
-                self.task_log_files[task_id] = log_file_path
+                runtime = TaskRuntime(log_entry_id=log_entry.id, log_file=log_file_path)
+                runtime.existing_paths.add(log_file_path)
                 logger.info(f"任务 {task_id} 日志条目已创建，ID: {log_entry.id}")
                 
                 # 构建完整的命令
@@ -531,11 +547,8 @@ class TaskScheduler:
                     original_command = task.main_program_command.strip()
                 
                 # 使用日志包装脚本启动任务
-                # 获取包装脚本路径
-                script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                wrapper_script = os.path.join(script_dir, 'utils', 'log_wrapper.py')
-                # 确保使用绝对路径
-                wrapper_script = os.path.abspath(wrapper_script)
+                # 获取包装脚本路径（绝对路径）
+                wrapper_script = str(BASE_DIR / 'utils' / 'log_wrapper.py')
                 
                 # 确保包装脚本存在
                 if not os.path.exists(wrapper_script):
@@ -544,7 +557,7 @@ class TaskScheduler:
                 
                 # 构建使用包装脚本的命令
                 # 直接传递参数，避免Windows shell转义问题
-                log_dir = log_service.log_dir
+                log_dir = str(log_service.log_dir)
                 
                 # 使用Python解释器运行包装脚本
                 python_executable = sys.executable
@@ -590,15 +603,15 @@ class TaskScheduler:
                 # 使用包装脚本启动，输出会被包装脚本处理
                 # 包装脚本会将输出写入日志文件并实现轮转
                 # 直接传递参数列表，避免Windows shell转义问题
+                # 包装脚本自己负责写日志文件，不向stdout输出，丢弃即可（不再作为第二个写入方追加到日志文件）
                 process = subprocess.Popen(
                     wrapper_args,  # 使用参数列表而不是命令字符串
                     shell=False,   # 不使用shell，直接执行
-                    stdout=subprocess.PIPE,  # 包装脚本的输出（包含日志文件路径）
-                    stderr=subprocess.PIPE,   # 包装脚本的错误输出
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,   # 包装脚本的错误输出（包含日志文件路径）
                     cwd=None,
                     env=env,
-                    text=True,  # 使用文本模式，便于读取
-                    encoding='utf-8',
+                    text=True,  # stderr使用文本模式，便于逐行读取
                     errors='replace'  # 遇到编码错误时替换而不是失败
                 )
                 
@@ -624,7 +637,7 @@ class TaskScheduler:
                                         # 更新日志文件路径（如果不同）
                                         if actual_log_path != log_file_path:
                                             logger.warning(f"任务 {task_id} 实际日志路径与预期不同: 预期={log_file_path}, 实际={actual_log_path}")
-                                            self.task_log_files[task_id] = actual_log_path
+                                            runtime.log_file = actual_log_path
                                 # 检查错误信息
                                 elif 'ERROR:' in line_str or 'Error:' in line_str:
                                     logger.error(f"任务 {task_id} 错误: {line_str}")
@@ -685,13 +698,8 @@ class TaskScheduler:
                     await service.update_task_status(task_id, TaskStatus.FAILED)
                     
                     # 结束日志记录
-                    if task_id in self.task_log_entries:
-                        await log_service.end_log_entry(self.task_log_entries[task_id])
-                        del self.task_log_entries[task_id]
-                    
-                    # 清理进程
-                    if task_id in self.running_processes:
-                        del self.running_processes[task_id]
+                    await log_service.end_log_entry(runtime.log_entry_id)
+                    runtime.log_entry_id = None
                     
                     raise Exception(f"{error_msg}. stderr: {'; '.join(stderr_lines[:5])}")  # 只显示前5行
                 
@@ -712,12 +720,13 @@ class TaskScheduler:
                     if actual_log_path and os.path.exists(actual_log_path):
                         logger.info(f"任务 {task_id} 找到实际日志文件: {actual_log_path}")
                         log_file_path = actual_log_path
-                        self.task_log_files[task_id] = actual_log_path
+                        runtime.log_file = actual_log_path
                     else:
                         logger.error(f"任务 {task_id} 无法找到日志文件")
                 
                 # 保存进程信息
-                self.running_processes[task_id] = process
+                runtime.process = process
+                self.tasks[task_id] = runtime
                 await service.update_task_status(task_id, TaskStatus.RUNNING, process.pid)
                 
                 logger.info(f"任务 {task.name} (ID: {task_id}) 已启动，PID: {process.pid}")
@@ -732,8 +741,8 @@ class TaskScheduler:
                 
                 # 将错误信息写入日志文件
                 try:
-                    if task_id in self.task_log_files:
-                        log_file_path = self.task_log_files[task_id]
+                    if runtime and runtime.log_file:
+                        log_file_path = runtime.log_file
                     else:
                         log_file_path = log_service.generate_log_file_path(task_id, task.name if task else f"任务{task_id}")
                     
@@ -756,19 +765,18 @@ class TaskScheduler:
                 await service.update_task_status(task_id, TaskStatus.FAILED)
                 
                 # 结束日志记录
-                if task_id in self.task_log_entries:
-                    await log_service.end_log_entry(self.task_log_entries[task_id])
-                    del self.task_log_entries[task_id]
+                if runtime and runtime.log_entry_id is not None:
+                    await log_service.end_log_entry(runtime.log_entry_id)
                 
                 # 清理进程
-                if task_id in self.running_processes:
+                if task_id in self.tasks:
                     try:
-                        process = self.running_processes[task_id]
+                        process = self.tasks[task_id].process
                         if process.poll() is None:
                             process.terminate()
                     except:
                         pass
-                    del self.running_processes[task_id]
+                    del self.tasks[task_id]
     
     async def stop_task(self, task_id: int) -> bool:
         """停止任务"""
@@ -782,8 +790,9 @@ class TaskScheduler:
             
             try:
                 # 停止进程
-                if task_id in self.running_processes:
-                    process = self.running_processes[task_id]
+                runtime = self.tasks.get(task_id)
+                if runtime:
+                    process = runtime.process
                     
                     # 尝试优雅停止
                     try:
@@ -807,15 +816,14 @@ class TaskScheduler:
                     except (psutil.NoSuchProcess, psutil.AccessDenied):
                         pass
                     
-                    del self.running_processes[task_id]
+                    del self.tasks[task_id]
                 
                 # 更新任务状态
                 await service.update_task_status(task_id, TaskStatus.STOPPED, None)
                 
                 # 结束日志记录
-                if task_id in self.task_log_entries:
-                    await log_service.end_log_entry(self.task_log_entries[task_id])
-                    del self.task_log_entries[task_id]
+                if runtime and runtime.log_entry_id is not None:
+                    await log_service.end_log_entry(runtime.log_entry_id)
                 
                 # 清理旧日志文件
                 await log_service.cleanup_old_logs(task_id)
@@ -845,88 +853,111 @@ class TaskScheduler:
         async with AsyncSessionLocal() as db:
             service = TaskService(db)
             log_service = LogService(db)
+            # 本轮已结束的任务：(task_id, exit_code, 最终状态)，提交成功后再清理内存记录
+            finished_tasks = []
             
-            # 检查运行中的任务
-            for task_id, process in list(self.running_processes.items()):
+            # 扫描一次日志目录，记录每个运行中任务最新的日志文件：task_id -> (mtime, 路径)
+            latest_by_task: Dict[int, Tuple[float, str]] = {}
+            log_dir = log_service.log_dir
+            if self.tasks and os.path.exists(log_dir):
                 try:
-                    # 检查进程是否还在运行
-                    if process.poll() is not None:
-                        # 进程已结束
-                        exit_code = process.returncode
-                        
-                        if exit_code == 0:
-                            await service.update_task_status(task_id, TaskStatus.COMPLETED, None)
-                        else:
-                            await service.update_task_status(task_id, TaskStatus.FAILED, None)
-                        
-                        # 结束日志记录
-                        if task_id in self.task_log_entries:
-                            await log_service.end_log_entry(self.task_log_entries[task_id])
-                            del self.task_log_entries[task_id]
-                        
-                        # 清理日志文件记录
-                        if task_id in self.task_log_files:
-                            del self.task_log_files[task_id]
-                        
-                        # 关闭文件句柄
-                        if process.stdout and not process.stdout.closed:
-                            try:
-                                process.stdout.close()
-                            except:
-                                pass
-                        
-                        del self.running_processes[task_id]
-                        
-                        task = await service.get_task(task_id)
-                        if task:
-                            print(f"任务 {task.name} (ID: {task_id}) 已结束，退出码: {exit_code}")
-                    else:
-                        # 进程仍在运行，检查是否有新的日志文件（包装脚本可能已经轮转了）
-                        # 扫描日志目录，查找该任务的新日志文件
-                        log_dir = log_service.log_dir
-                        if os.path.exists(log_dir):
-                            # 查找该任务的所有日志文件
-                            import glob
-                            pattern = os.path.join(log_dir, f"task_{task_id}_*.txt")
-                            log_files = glob.glob(pattern)
+                    with os.scandir(log_dir) as entries:
+                        for entry in entries:
+                            match = _TASK_LOG_RE.match(entry.name)
+                            if not match:
+                                continue
+                            entry_task_id = int(match.group(1))
+                            if entry_task_id not in self.tasks:
+                                continue
+                            mtime = entry.stat().st_mtime
+                            latest = latest_by_task.get(entry_task_id)
+                            if latest is None or mtime > latest[0]:
+                                latest_by_task[entry_task_id] = (mtime, entry.path)
+                except OSError as e:
+                    logger.warning(f"扫描日志目录失败: {str(e)}")
+            
+            # 检查运行中的任务（本轮所有数据库变更在同一事务中提交，
+            # 每个任务的变更放在各自的SAVEPOINT中，单个任务出错只回滚该任务的变更）
+            for task_id, runtime in list(self.tasks.items()):
+                try:
+                    async with db.begin_nested():
+                        process = runtime.process
+                        # 检查进程是否还在运行
+                        if process.poll() is not None:
+                            # 进程已结束
+                            exit_code = process.returncode
+                            
+                            final_status = TaskStatus.COMPLETED if exit_code == 0 else TaskStatus.FAILED
+                            await service.update_task_status(task_id, final_status, None, commit=False)
                             
-                            # 按修改时间排序，获取最新的日志文件
-                            if log_files:
-                                log_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-                                latest_log_file = log_files[0]
+                            # 结束日志记录
+                            if runtime.log_entry_id is not None:
+                                await log_service.end_log_entry(runtime.log_entry_id, commit=False)
+                            
+                            finished_tasks.append((task_id, exit_code, final_status))
+                        else:
+                            # 进程仍在运行，检查是否有新的日志文件（包装脚本可能已经轮转了）
+                            latest = latest_by_task.get(task_id)
+                            if latest:
+                                latest_log_file = latest[1]
+                                # 将绝对路径转换为相对路径（与log_service保持一致）
+                                latest_log_file_rel = str(LOG_DIR_REL / os.path.basename(latest_log_file))
                                 
-                                # 检查这个文件是否已经在数据库中
-                                current_logs = await log_service.get_task_logs(task_id)
-                                existing_paths = {log.log_file_path for log in current_logs}
+                                # 检查这个文件是否已经在数据库中（本地缓存未命中时才查询数据库）
+                                existing_paths = runtime.existing_paths
+                                if latest_log_file_rel not in existing_paths and latest_log_file not in existing_paths:
+                                    current_logs = await log_service.get_task_logs(task_id)
+                                    existing_paths.update(log.log_file_path for log in current_logs)
                                 
                                 # 如果最新文件不在数据库中，创建新的日志记录
-                                # 将绝对路径转换为相对路径（与log_service保持一致）
-                                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                                latest_log_file_rel = os.path.relpath(latest_log_file, base_dir)
                                 if latest_log_file_rel not in existing_paths and latest_log_file not in existing_paths:
                                     logger.info(f"任务 {task_id} 检测到新日志文件：{latest_log_file}")
                                     # 使用相对路径创建日志记录
-                                    new_log_entry = await log_service.create_log_entry(task_id, latest_log_file_rel)
-                                    self.task_log_entries[task_id] = new_log_entry.id
-                                    self.task_log_files[task_id] = latest_log_file_rel
+                                    new_log_entry = await log_service.create_log_entry(task_id, latest_log_file_rel, commit=False)
+                                    runtime.log_entry_id = new_log_entry.id
+                                    runtime.log_file = latest_log_file_rel
+                                    existing_paths.add(latest_log_file_rel)
                                 
                                 # 检查是否有日志文件轮转
-                                if task_id in self.task_log_files:
-                                    current_log_path = self.task_log_files[task_id]
+                                if runtime.log_file is not None:
+                                    current_log_path = runtime.log_file
                                     # 比较时需要考虑相对路径和绝对路径（latest_log_file_rel已在上面计算）
                                     if latest_log_file_rel != current_log_path and latest_log_file != current_log_path:
                                         logger.info(f"任务 {task_id} 检测到日志文件轮转：{current_log_path} -> {latest_log_file_rel}")
                                         # 更新记录的日志文件路径（使用相对路径）
-                                        self.task_log_files[task_id] = latest_log_file_rel
+                                        runtime.log_file = latest_log_file_rel
                                         # 更新日志条目ID
                                         current_logs = await log_service.get_task_logs(task_id)
                                         for log in current_logs:
                                             if log.log_file_path == latest_log_file_rel or log.log_file_path == latest_log_file:
-                                                self.task_log_entries[task_id] = log.id
+                                                runtime.log_entry_id = log.id
                                                 break
-                
+            
                 except Exception as e:
+                    # 该任务的变更已回滚，清空路径缓存，下次检查时重新确认
+                    runtime.existing_paths.clear()
                     print(f"监控任务 {task_id} 时出错: {str(e)}")
+            
+            # 统一提交本轮的状态更新和日志记录
+            try:
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                # 本轮新建的日志记录未能写入，清空路径缓存，下次检查时重新确认
+                for runtime in self.tasks.values():
+                    runtime.existing_paths.clear()
+                logger.error(f"提交任务监控结果失败，将在下次检查时重试: {str(e)}")
+                return
+            
+            # 提交成功后清理已结束任务的运行时信息，并发布状态变更事件
+            for task_id, exit_code, final_status in finished_tasks:
+                if task_id in self.tasks:
+                    del self.tasks[task_id]
+                task_events.publish(task_id, final_status.value)
+                
+                task = await service.get_task(task_id)
+                if task:
+                    print(f"任务 {task.name} (ID: {task_id}) 已结束，退出码: {exit_code}")
     
     async def reschedule_task(self, task_id: int):
         """重新调度任务"""
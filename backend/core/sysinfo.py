@@ -0,0 +1,213 @@
+"""
+系统信息采集（CPU、内存、磁盘、GPU）
+"""
+import logging
+import shutil
+import subprocess
+import threading
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# 系统资源采样间隔（秒）
+SYSTEM_SAMPLE_INTERVAL = 1.0
+# 启动时首次同步采样CPU使用率的时长（秒），cpu_percent(interval=None)首次调用总是返回0.0
+CPU_SEED_INTERVAL = 0.1
+
+
+def _sample_system_usage(state, stop_event: threading.Event):
+    """后台线程：周期性采样CPU/内存/磁盘使用情况和GPU信息，写入state供/health直接读取"""
+    # 没有nvidia-smi时不再每个周期尝试启动
+    has_nvidia_smi = shutil.which('nvidia-smi') is not None
+    while not stop_event.is_set():
+        try:
+            if has_nvidia_smi:
+                state.gpu_info = get_gpu_memory_info()
+            # cpu_percent(interval)会阻塞一个采样周期，同时作为循环节拍
+            state.cpu_percent = psutil.cpu_percent(interval=SYSTEM_SAMPLE_INTERVAL)
+            state.memory = psutil.virtual_memory()
+            state.disk = psutil.disk_usage('/')
+        except Exception as e:
+            logger.warning(f"采样系统资源失败: {str(e)}")
+            stop_event.wait(SYSTEM_SAMPLE_INTERVAL)
+
+
+def start_system_sampler(state) -> threading.Event:
+    """启动系统资源采样线程，返回用于停止线程的事件
+
+    先同步采样一次CPU/内存/磁盘，保证/health始终有数据（GPU信息由采样线程首先获取）
+    """
+    state.cpu_percent = psutil.cpu_percent(interval=CPU_SEED_INTERVAL)
+    state.memory = psutil.virtual_memory()
+    state.disk = psutil.disk_usage('/')
+    state.gpu_info = {}
+    stop_event = threading.Event()
+    sampler_thread = threading.Thread(
+        target=_sample_system_usage,
+        args=(state, stop_event),
+        daemon=True
+    )
+    sampler_thread.start()
+    return stop_event
+
+
+def _parse_optional_float(value: str):
+    """解析nvidia-smi的可选数值字段，缺失值（空、N/A、[N/A]、[Not Supported]等）或无法解析时返回None"""
+    if not value or value[0] == '[' or value == 'N/A':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        # 本地化或未知的取值只丢弃该字段，不影响整张卡的数据
+        return None
+
+
+def get_gpu_memory_info():
+    """获取GPU显存信息（支持多卡），返回汇总与逐卡数据"""
+    try:
+        # 查询多卡详细信息：索引、名称、显存、利用率、温度、功耗、驱动版本、显存频率、核心频率
+        result = subprocess.run([
+            'nvidia-smi',
+            '--query-gpu=index,name,memory.used,memory.total,utilization.gpu,temperature.gpu,power.draw,driver_version,clocks.mem,clocks.gr',
+            '--format=csv,noheader,nounits'
+        ], capture_output=True, text=True, timeout=10)
+
+        if result.returncode != 0:
+            return {}
+
+        lines = [ln.strip() for ln in result.stdout.strip().split('\n') if ln.strip()]
+        if not lines:
+            return {}
+
+        cards = []
+        total_mb = 0
+        used_mb = 0
+        driver_version = None
+        
+        for ln in lines:
+            parts = [p.strip() for p in ln.split(',')]
+            # 期望: index, name, used(MB), total(MB), utilization(%), temperature(°C), power(W), driver_version, mem_clock(MHz), gr_clock(MHz)
+            if len(parts) < 5:
+                # 兼容部分环境输出带空格分隔
+                parts = [p.strip() for p in ln.split(', ')]
+            
+            # 至少需要5个字段（index, name, used, total, utilization）
+            if len(parts) >= 5:
+                try:
+                    idx = int(parts[0])
+                    name = parts[1]
+                    used = int(parts[2])
+                    total = int(parts[3])
+                    util = float(parts[4])
+                    
+                    # 可选字段
+                    temperature = None
+                    power_draw = None
+                    driver_ver = None
+                    mem_clock = None
+                    gr_clock = None
+                    
+                    if len(parts) >= 6:
+                        temperature = _parse_optional_float(parts[5])
+                    
+                    if len(parts) >= 7:
+                        power_draw = _parse_optional_float(parts[6])
+                    
+                    if len(parts) >= 8 and parts[7]:
+                        driver_ver = parts[7]
+                        if not driver_version:  # 保存第一个驱动版本（通常所有卡相同）
+                            driver_version = driver_ver
+                    
+                    if len(parts) >= 9:
+                        mem_clock = _parse_optional_float(parts[8])
+                    
+                    if len(parts) >= 10:
+                        gr_clock = _parse_optional_float(parts[9])
+
+                    percent = (used / total) * 100 if total > 0 else 0.0
+                    card_info = {
+                        "index": idx,
+                        "name": name,
+                        "memory_used_mb": used,
+                        "memory_total_mb": total,
+                        "percent": round(percent, 1),
+                        "utilization_percent": round(util, 1),
+                    }
+                    
+                    # 添加可选字段
+                    if temperature is not None:
+                        card_info["temperature_celsius"] = round(temperature, 1)
+                    if power_draw is not None:
+                        card_info["power_draw_watts"] = round(power_draw, 1)
+                    if driver_ver:
+                        card_info["driver_version"] = driver_ver
+                    if mem_clock is not None:
+                        card_info["memory_clock_mhz"] = round(mem_clock, 1)
+                    if gr_clock is not None:
+                        card_info["graphics_clock_mhz"] = round(gr_clock, 1)
+                    
+                    cards.append(card_info)
+                    total_mb += total
+                    used_mb += used
+                except ValueError as e:
+                    # 输出格式异常时跳过该行
+                    continue
+
+        if not cards:
+            return {}
+
+        usage_percent = (used_mb / total_mb) * 100 if total_mb > 0 else 0.0
+        result = {
+            # 汇总（保持原有字段以兼容前端）
+            "gpu_memory_usage": f"{usage_percent:.1f}%",
+            "gpu_memory_total": f"{total_mb // 1024}GB",
+            # 逐卡数据
+            "gpus": cards,
+            # 平均利用率（简单平均）
+            "gpu_percent_avg": round(sum(c.get("percent", 0) for c in cards) / len(cards), 1)
+        }
+        
+        # 添加驱动版本信息（如果可用）
+        if driver_version:
+            result["gpu_driver_version"] = driver_version
+        
+        return result
+    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError):
+        # nvidia-smi不存在或执行失败，返回空字典
+        return {}
+
+
+async def get_system_info(state) -> dict:
+    """构建系统信息（CPU/内存/磁盘/GPU均读取采样线程的结果）"""
+    # 获取系统资源使用情况（由后台采样线程维护，无需阻塞等待）
+    cpu_percent = state.cpu_percent
+    memory = state.memory
+    disk = state.disk
+    gpu_info = state.gpu_info
+    
+    # 获取CPU详细信息
+    cpu_count_physical = psutil.cpu_count(logical=False)  # 物理核心数
+    cpu_count_logical = psutil.cpu_count(logical=True)    # 逻辑核心数
+    cpu_freq = psutil.cpu_freq()
+    cpu_freq_current = cpu_freq.current if cpu_freq else None
+    cpu_freq_max = cpu_freq.max if cpu_freq else None
+
+    # 构建系统信息
+    system_info = {
+        "cpu_usage": f"{cpu_percent}%",
+        "cpu_count_physical": cpu_count_physical,
+        "cpu_count_logical": cpu_count_logical,
+        "cpu_freq_current_mhz": round(cpu_freq_current, 2) if cpu_freq_current else None,
+        "cpu_freq_max_mhz": round(cpu_freq_max, 2) if cpu_freq_max else None,
+        "memory_usage": f"{memory.percent}%",
+        "disk_usage": f"{disk.percent}%",
+        "memory_total": f"{memory.total // (1024 ** 3)}GB",
+        "disk_total": f"{disk.total // (1024 ** 3)}GB"
+    }
+
+    # 如果有GPU信息，添加到系统信息中
+    if gpu_info:
+        system_info.update(gpu_info)
+
+    return system_info
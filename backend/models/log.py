@@ -1,10 +1,9 @@
 """
 日志数据模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from datetime import datetime
 from core.database import Base
 
 
@@ -15,9 +14,20 @@ class TaskLog(Base):
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, comment="任务ID")
     log_file_path = Column(String(500), nullable=False, comment="日志文件路径")
-    start_time = Column(DateTime, nullable=False, comment="日志开始时间")
+    start_time = Column(DateTime, nullable=False, default=func.now(), server_default=func.now(), comment="日志开始时间")
     end_time = Column(DateTime, nullable=True, comment="日志结束时间")
-    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    log_date = Column(Date, nullable=True, comment="日志日期")
+    part_num = Column(Integer, nullable=False, default=1, comment="日志文件部分号")
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), comment="创建时间")
+    
+    task = relationship("Task", back_populates="logs")
+    
+    __table_args__ = (
+        # 按任务查询日志并按创建时间倒序排列
+        Index("ix_tasklog_task_created", task_id, created_at.desc()),
+        # 日志轮换时按任务和日期查询最大部分号
+        Index("ix_tasklog_task_date_part", task_id, log_date, part_num),
+    )
     
     def __repr__(self):
         return f"<TaskLog(id={self.id}, task_id={self.task_id}, log_file='{self.log_file_path}')>"
\ No newline at end of file
@@ -2,7 +2,7 @@
 系统配置数据模型
 """
 from sqlalchemy import Column, Integer, String, DateTime, Text
-from datetime import datetime
+from sqlalchemy.sql import func
 from core.database import Base
 
 
@@ -14,8 +14,8 @@ class SystemConfig(Base):
     key = Column(String(255), unique=True, nullable=False, index=True, comment="配置键")
     value = Column(Text, nullable=True, comment="配置值")
     description = Column(Text, nullable=True, comment="配置描述")
-    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now(), comment="更新时间")
     
     def __repr__(self):
         return f"<SystemConfig(id={self.id}, key='{self.key}', value='{self.value}')>"
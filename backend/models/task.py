@@ -1,11 +1,17 @@
 """
 任务数据模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Enum
-from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Index
+from sqlalchemy.orm import Mapped, relationship
+from sqlalchemy.sql import func
+from typing import Literal
 import enum
 from core.database import Base
 
+# 数据库中存储的字符串取值（与枚举的value一致）
+RepeatTypeValue = Literal["none", "daily", "weekly", "monthly", "quarterly"]
+TaskStatusValue = Literal["pending", "running", "stopped", "completed", "failed"]
+
 
 class RepeatType(enum.Enum):
     """重复类型枚举"""
@@ -33,13 +39,21 @@ class Task(Base):
     name = Column(String(255), nullable=False, comment="任务名称")
     activate_env_command = Column(Text, nullable=False, comment="激活环境命令")
     main_program_command = Column(Text, nullable=False, comment="主程序命令")
-    repeat_type = Column(Enum(RepeatType), default=RepeatType.NONE, comment="重复类型")
+    repeat_type: Mapped[RepeatTypeValue] = Column(String(16), default=RepeatType.NONE.value, comment="重复类型")
     start_time = Column(DateTime, nullable=False, comment="开始时间")
     end_time = Column(DateTime, nullable=True, comment="结束时间")
-    status = Column(Enum(TaskStatus), default=TaskStatus.PENDING, comment="任务状态")
+    status: Mapped[TaskStatusValue] = Column(String(16), default=TaskStatus.PENDING.value, comment="任务状态")
     process_id = Column(Integer, nullable=True, comment="进程ID")
-    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+    
+    # 任务日志（按创建时间倒序），异步会话中需通过selectinload预加载
+    logs = relationship("TaskLog", back_populates="task", order_by="[TaskLog.created_at.desc(), TaskLog.id.desc()]")
+    
+    __table_args__ = (
+        # 调度器按状态查询运行中/等待中的任务
+        Index("ix_task_status", status),
+    )
     
     def __repr__(self):
         return f"<Task(id={self.id}, name='{self.name}', status='{self.status}')>"
\ No newline at end of file
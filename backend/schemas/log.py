@@ -2,7 +2,7 @@
 日志相关的Pydantic模式
 """
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional
 
 
@@ -13,6 +13,8 @@ class TaskLogResponse(BaseModel):
     log_file_path: str
     start_time: datetime
     end_time: Optional[datetime]
+    log_date: Optional[date] = None
+    part_num: int = 1
     created_at: datetime
 
     class Config:
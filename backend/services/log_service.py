@@ -1,18 +1,277 @@
 """
 日志服务层
 """
+import asyncio
+import codecs
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from typing import List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, func, bindparam, lambda_stmt
+from typing import Dict, List, Optional, Tuple
 import os
-import aiofiles
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 
+from core.paths import BASE_DIR, LOG_DIR
 from models.log import TaskLog
+from models.task import Task
+
+# 预构建的热点查询语句（lambda_stmt缓存语句结构，调用时只传入绑定参数）
+_GET_TASK_LOGS_STMT = lambda_stmt(
+    lambda: select(TaskLog)
+    .where(TaskLog.task_id == bindparam('task_id'))
+    .order_by(TaskLog.created_at.desc(), TaskLog.id.desc())
+)
+
+# 可选依赖：用于加速大块数据的换行符统计，未安装时使用bytes.count
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 logger = logging.getLogger(__name__)
 
+# 从文件末尾读取日志时每次读取的块大小
+TAIL_BLOCK_SIZE = 64 * 1024
+# 探测日志编码时使用的样本大小
+ENCODING_SAMPLE_SIZE = 4096
+# 查找任务输出样本时最多扫描的字节数
+ENCODING_SCAN_SIZE = 64 * 1024
+# 非UTF-8日志使用的编码（任务在中文Windows上的默认输出编码）
+FALLBACK_ENCODING = 'gbk'
+# 统计文件行数时每次读取的块大小
+COUNT_BLOCK_SIZE = 1024 * 1024
+# 数据块达到该大小时使用NumPy统计换行符
+NUMPY_COUNT_THRESHOLD = 256 * 1024
+# 行数缓存的最大文件数
+MAX_LINE_COUNT_CACHE = 1024
+
+# 单个日志文件的最大行数
+MAX_LOG_LINES = 50000
+# 按大小预检查的字节阈值（约对应MAX_LOG_LINES行），小于该值且计数未超限时跳过精确行数统计
+ROTATE_SIZE_BYTES = 5 * 1024 * 1024
+
+# 日志包装器和调度器写入的标记行（始终为UTF-8编码，任务输出则保持原始编码）
+_MARKER_TAGS = (
+    '任务启动', '任务结束', '任务停止', '进程启动', '日志文件轮换', '日志包装器接管', '日志丢弃',
+    '错误', '错误详情', '错误堆栈', '输出内容', '异常', '异常堆栈',
+)
+_MARKER_LINE_RE = re.compile(
+    rb'^\[(?:' + b'|'.join(tag.encode('utf-8') for tag in _MARKER_TAGS) + rb')\][^\n]*\n?',
+    re.M
+)
+# 任务输出中的非ASCII字节（ASCII在UTF-8和GBK中相同，只有非ASCII部分能区分编码）
+_NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+# 任务名中不能出现在日志文件名里的字符（保留Unicode字母数字、空格、-和_）
+_SAFE_RE = re.compile(r'[^\w \-]+')
+
+# 日志文件读取专用线程池大小，避免大量并发查看日志时占满默认线程池
+LOG_IO_WORKERS = 4
+_log_io_executor = ThreadPoolExecutor(max_workers=LOG_IO_WORKERS, thread_name_prefix="log-io")
+
+# 日志文件行数计数：路径 -> 已写入行数（由写入方通过increment_line_count累加）
+_line_counts: Dict[str, int] = {}
+
+# 日志文件换行符数量缓存：路径 -> (已统计的字节数, 换行符数量)
+# 日志文件只追加写入，再次读取时只需统计新增部分
+_line_count_cache: Dict[str, Tuple[int, int]] = {}
+
+
+def _count_newline_bytes(chunk: bytes) -> int:
+    """统计数据块中的换行符数量（大块数据且安装了NumPy时使用向量化比较）"""
+    if np is not None and len(chunk) >= NUMPY_COUNT_THRESHOLD:
+        return int(np.count_nonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0a))
+    return chunk.count(b'\n')
+
+
+def _detect_encoding(sample: bytes) -> str:
+    """根据样本字节探测日志编码（能按UTF-8解码则为UTF-8，否则为FALLBACK_ENCODING）"""
+    try:
+        # 增量解码器允许样本末尾存在被截断的多字节字符
+        codecs.getincrementaldecoder('utf-8')().decode(sample)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+def detect_log_encoding(data: bytes) -> Optional[str]:
+    """从任务输出部分探测日志编码：去掉UTF-8标记行，从第一个非ASCII字节开始取样
+    
+    任务输出中还没有非ASCII字符（无法区分编码）时返回None
+    """
+    output = _MARKER_LINE_RE.sub(b'', data[:ENCODING_SCAN_SIZE])
+    match = _NON_ASCII_RE.search(output)
+    if match is None:
+        return None
+    start = match.start()
+    return _detect_encoding(output[start:start + ENCODING_SAMPLE_SIZE])
+
+
+def decode_log_bytes(data: bytes, encoding: Optional[str] = None) -> str:
+    """解码日志内容：任务输出按指定（或探测到的）编码解码，标记行按UTF-8解码，无法解码的字节替换显示而不是丢弃"""
+    if encoding is None:
+        encoding = detect_log_encoding(data) or 'utf-8'
+    if encoding == 'utf-8':
+        return data.decode('utf-8', errors='replace')
+    
+    parts = []
+    pos = 0
+    for match in _MARKER_LINE_RE.finditer(data):
+        parts.append(data[pos:match.start()].decode(encoding, errors='replace'))
+        parts.append(match.group().decode('utf-8', errors='replace'))
+        pos = match.end()
+    parts.append(data[pos:].decode(encoding, errors='replace'))
+    return ''.join(parts)
+
+
+class LogStreamDecoder:
+    """实时日志增量解码器（每个日志文件一个）
+    
+    编码探测到后在该文件的后续增量中沿用；增量末尾被截断的多字节字符留到下次读取时再解码
+    """
+    
+    def __init__(self):
+        self.encoding: Optional[str] = None
+        self._pending = b''
+    
+    def reset(self):
+        """丢弃尚未解码的字节（跳过部分内容后调用）"""
+        self._pending = b''
+    
+    def decode(self, data: bytes) -> str:
+        """解码一次读取到的增量内容"""
+        data = self._pending + data
+        if self.encoding is None:
+            self.encoding = detect_log_encoding(data)
+        encoding = self.encoding or 'utf-8'
+        
+        # 换行符不会出现在多字节字符内部，只需检查最后一行末尾是否有不完整的字符
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        decoder.decode(data[data.rfind(b'\n') + 1:])
+        held = len(decoder.getstate()[0])
+        self._pending = data[len(data) - held:] if held else b''
+        return decode_log_bytes(data[:len(data) - held], encoding)
+
+
+def _count_newlines(f, log_file_path: str, file_size: int) -> int:
+    """统计文件前file_size字节中的换行符数量（基于缓存增量统计）"""
+    cached = _line_count_cache.get(log_file_path)
+    if cached and cached[0] <= file_size:
+        offset, count = cached
+    else:
+        offset, count = 0, 0
+    
+    f.seek(offset)
+    while offset < file_size:
+        chunk = f.read(min(COUNT_BLOCK_SIZE, file_size - offset))
+        if not chunk:
+            break
+        count += _count_newline_bytes(chunk)
+        offset += len(chunk)
+    
+    if len(_line_count_cache) >= MAX_LINE_COUNT_CACHE:
+        _line_count_cache.clear()
+    _line_count_cache[log_file_path] = (offset, count)
+    return count
+
+
+def _tail_lines(log_file_path: str, max_lines: int) -> Tuple[str, int]:
+    """从文件末尾按块向前读取，返回(最后max_lines行内容, 文件总行数)"""
+    with open(log_file_path, 'rb', buffering=0) as f:
+        file_size = os.fstat(f.fileno()).st_size
+        
+        # 向前读取，直到换行符数量足够覆盖max_lines行
+        chunks = []
+        newlines = 0
+        offset = file_size
+        while offset > 0 and newlines <= max_lines:
+            read_size = min(TAIL_BLOCK_SIZE, offset)
+            offset -= read_size
+            f.seek(offset)
+            chunk = f.read(read_size)
+            chunks.append(chunk)
+            newlines += chunk.count(b'\n')
+        tail = b''.join(reversed(chunks))
+        
+        # 统计总行数：已读到文件开头时直接使用本次结果，否则使用缓存增量统计
+        if offset == 0:
+            total_newlines = newlines
+        else:
+            total_newlines = _count_newlines(f, log_file_path, file_size)
+    
+    # 最后一行没有换行符时也算一行
+    total_lines = total_newlines + (1 if tail and not tail.endswith(b'\n') else 0)
+    
+    # 只保留最后max_lines行（结尾的换行符属于最后一行）
+    body = tail[:-1] if tail.endswith(b'\n') else tail
+    parts = body.rsplit(b'\n', max_lines)
+    if len(parts) > max_lines:
+        tail = tail[len(parts[0]) + 1:]
+    
+    return decode_log_bytes(tail), total_lines
+
+
+def _parse_log_file_name(log_file_path: str) -> Tuple[Optional[date], int]:
+    """从日志文件名中解析日期和部分号
+    
+    文件名格式: task_{task_id}_{task_name}_{date}_{time}[_part{N}].txt
+    """
+    filename = os.path.basename(log_file_path)
+    file_date = None
+    part_num = 1
+    
+    # 查找日期部分（格式：YYYYMMDD）
+    for part in filename.replace('.txt', '').split('_'):
+        if len(part) == 8 and part.isdigit():
+            try:
+                file_date = datetime.strptime(part, "%Y%m%d").date()
+            except ValueError:
+                pass
+            break
+    
+    # 查找部分号
+    if '_part' in filename:
+        try:
+            part_num = int(filename.rsplit('_part', 1)[1].replace('.txt', ''))
+        except ValueError:
+            pass
+    
+    return file_date, part_num
+
+
+async def _run_log_io(func, *args):
+    """在日志读取专用线程池中执行阻塞的文件操作"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_log_io_executor, func, *args)
+
+
+def _remove_log_file(log_file_path: str):
+    """删除日志文件（相对路径基于BASE_DIR解析），文件不存在时忽略"""
+    if not os.path.isabs(log_file_path):
+        log_file_path = os.path.join(BASE_DIR, log_file_path)
+    _line_counts.pop(log_file_path, None)
+    _line_count_cache.pop(log_file_path, None)
+    try:
+        os.remove(log_file_path)
+    except FileNotFoundError:
+        pass
+
+
+def _fast_linecount(log_file_path: str, limit: int) -> int:
+    """按块统计文件换行符数量，达到limit后提前返回（结果最多为limit）"""
+    count = 0
+    fd = os.open(log_file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        while count < limit:
+            chunk = os.read(fd, COUNT_BLOCK_SIZE)
+            if not chunk:
+                break
+            count += _count_newline_bytes(chunk)
+    finally:
+        os.close(fd)
+    return min(count, limit)
+
 
 class LogService:
     """日志服务类"""
@@ -20,229 +279,126 @@ class LogService:
     def __init__(self, db: AsyncSession):
         self.db = db
         # 使用绝对路径，基于backend目录
-        # 获取backend目录的绝对路径
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.log_dir = os.path.join(base_dir, "logs")
+        self.log_dir = LOG_DIR
         # 确保日志目录存在
         os.makedirs(self.log_dir, exist_ok=True)
     
-    async def create_log_entry(self, task_id: int, log_file_path: str) -> TaskLog:
-        """创建日志记录"""
+    async def create_log_entry(
+        self,
+        task_id: int,
+        log_file_path: str,
+        commit: bool = True,
+        log_date: Optional[date] = None,
+        part_num: Optional[int] = None
+    ) -> TaskLog:
+        """创建日志记录（commit=False时只flush，由调用方统一提交事务）
+        
+        log_date/part_num未指定时从文件名中解析，只在创建时解析一次
+        """
+        if log_date is None or part_num is None:
+            file_date, file_part = _parse_log_file_name(log_file_path)
+            if log_date is None:
+                log_date = file_date
+            if part_num is None:
+                part_num = file_part
+        
         log_entry = TaskLog(
             task_id=task_id,
             log_file_path=log_file_path,
-            start_time=datetime.utcnow()
+            log_date=log_date,
+            part_num=part_num
         )
         
         self.db.add(log_entry)
+        if not commit:
+            await self.db.flush()
+            return log_entry
         await self.db.commit()
         await self.db.refresh(log_entry)
         return log_entry
     
+    def increment_line_count(self, log_file_path: str, n: int = 1):
+        """累加日志文件的已写入行数（由写入日志的一方调用）"""
+        _line_counts[log_file_path] = _line_counts.get(log_file_path, 0) + n
+    
     async def get_task_logs(self, task_id: int) -> List[TaskLog]:
         """获取任务的所有日志"""
-        result = await self.db.execute(
-            select(TaskLog)
-            .where(TaskLog.task_id == task_id)
-            .order_by(TaskLog.created_at.desc())
-        )
+        result = await self.db.execute(_GET_TASK_LOGS_STMT, {'task_id': task_id})
         return result.scalars().all()
     
     async def get_log_content(self, log_file_path: str, max_lines: int = 10000) -> tuple[str, int]:
-        """读取日志文件内容（优化：从文件末尾读取，避免读取整个大文件）"""
+        """读取日志文件内容（从文件末尾按块读取，只解码最后max_lines行）"""
         # 如果传入的是相对路径，转换为绝对路径
         if not os.path.isabs(log_file_path):
-            # 获取当前文件所在目录的绝对路径
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            log_file_path = os.path.join(base_dir, log_file_path)
+            log_file_path = os.path.join(BASE_DIR, log_file_path)
         
         if not os.path.exists(log_file_path):
             return f"日志文件不存在: {log_file_path}", 0
         
         try:
-            # 获取文件大小
-            file_size = os.path.getsize(log_file_path)
-            file_size_mb = file_size / (1024 * 1024)
-            
-            # 如果文件大于5MB，使用优化的读取方式（只读取最后部分）
-            if file_size_mb > 5:
-                logger.info(f"日志文件较大 ({file_size_mb:.2f}MB)，使用优化读取方式")
-                return await self._read_log_tail(log_file_path, max_lines)
-            
-            # 小文件，使用原来的方式读取
-            # 尝试多种编码方式读取
-            encodings = ['utf-8', 'gbk', 'gb2312', 'cp936', 'latin-1']
-            for encoding in encodings:
-                try:
-                    async with aiofiles.open(log_file_path, 'r', encoding=encoding, errors='ignore') as f:
-                        lines = await f.readlines()
-                        total_lines = len(lines)
-                        
-                        # 只返回最后max_lines行
-                        if total_lines > max_lines:
-                            lines = lines[-max_lines:]
-                        
-                        content = ''.join(lines)
-                        return content, total_lines
-                except UnicodeDecodeError:
-                    continue
-            
-            # 如果所有编码都失败，以二进制模式读取并忽略错误
-            async with aiofiles.open(log_file_path, 'r', encoding='utf-8', errors='replace') as f:
-                lines = await f.readlines()
-                total_lines = len(lines)
-                
-                if total_lines > max_lines:
-                    lines = lines[-max_lines:]
-                
-                content = ''.join(lines)
-                return content, total_lines
+            return await _run_log_io(_tail_lines, log_file_path, max_lines)
         except Exception as e:
             logger.error(f"读取日志文件失败: {str(e)}")
             return f"读取日志文件失败: {str(e)}", 0
     
-    async def _read_log_tail(self, log_file_path: str, max_lines: int) -> tuple[str, int]:
-        """从文件末尾读取最后max_lines行（优化大文件读取）"""
-        try:
-            # 估算：假设平均每行100字符，max_lines行约需要 max_lines * 100 字节
-            # 为了安全，读取更多内容（3倍），确保能获取足够的行数
-            estimated_size = max_lines * 300  # 每行约300字节（包括中文字符）
-            # 限制最大读取大小为5MB
-            read_size = min(estimated_size, 5 * 1024 * 1024)
-            
-            file_size = os.path.getsize(log_file_path)
-            start_pos = max(0, file_size - read_size)
-            
-            # 尝试多种编码
-            encodings = ['utf-8', 'gbk', 'gb2312', 'cp936', 'latin-1']
-            for encoding in encodings:
-                try:
-                    async with aiofiles.open(log_file_path, 'rb') as f:
-                        await f.seek(start_pos)
-                        tail_bytes = await f.read()
-                        
-                        # 尝试解码
-                        try:
-                            tail_text = tail_bytes.decode(encoding, errors='ignore')
-                        except:
-                            continue
-                        
-                        # 如果从中间开始读取，跳过第一行（可能不完整）
-                        if start_pos > 0:
-                            first_newline = tail_text.find('\n')
-                            if first_newline > 0:
-                                tail_text = tail_text[first_newline + 1:]
-                        
-                        # 分割行并获取最后max_lines行
-                        lines = tail_text.splitlines(keepends=True)
-                        total_lines = self._count_total_lines(log_file_path)
-                        
-                        if len(lines) > max_lines:
-                            lines = lines[-max_lines:]
-                        
-                        content = ''.join(lines)
-                        return content, total_lines
-                except Exception as e:
-                    logger.debug(f"使用编码 {encoding} 读取失败: {str(e)}")
-                    continue
-            
-            # 如果所有编码都失败，使用utf-8并忽略错误
-            async with aiofiles.open(log_file_path, 'rb') as f:
-                await f.seek(start_pos)
-                tail_bytes = await f.read()
-                tail_text = tail_bytes.decode('utf-8', errors='replace')
-                
-                if start_pos > 0:
-                    first_newline = tail_text.find('\n')
-                    if first_newline > 0:
-                        tail_text = tail_text[first_newline + 1:]
-                
-                lines = tail_text.splitlines(keepends=True)
-                total_lines = self._count_total_lines(log_file_path)
-                
-                if len(lines) > max_lines:
-                    lines = lines[-max_lines:]
-                
-                content = ''.join(lines)
-                return content, total_lines
-                
-        except Exception as e:
-            logger.error(f"从文件末尾读取日志失败: {str(e)}")
-            # 回退到原始方法
-            return await self._read_log_fallback(log_file_path, max_lines)
-    
-    def _count_total_lines(self, log_file_path: str) -> int:
-        """快速统计文件总行数（用于大文件）"""
-        try:
-            # 使用二进制模式快速统计换行符
-            line_count = 0
-            with open(log_file_path, 'rb') as f:
-                # 读取大块数据以提高效率
-                chunk_size = 1024 * 1024  # 1MB块
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    line_count += chunk.count(b'\n')
-            return line_count
-        except:
-            # 如果统计失败，返回一个估算值
-            try:
-                file_size = os.path.getsize(log_file_path)
-                # 假设平均每行100字节
-                return int(file_size / 100)
-            except:
-                return 0
-    
-    async def _read_log_fallback(self, log_file_path: str, max_lines: int) -> tuple[str, int]:
-        """回退方法：读取整个文件（用于小文件或优化方法失败时）"""
-        try:
-            async with aiofiles.open(log_file_path, 'r', encoding='utf-8', errors='replace') as f:
-                lines = await f.readlines()
-                total_lines = len(lines)
-                
-                if total_lines > max_lines:
-                    lines = lines[-max_lines:]
-                
-                content = ''.join(lines)
-                return content, total_lines
-        except Exception as e:
-            return f"读取日志文件失败: {str(e)}", 0
-    
     async def cleanup_old_logs(self, task_id: int, max_files: int = 7):
         """清理旧的日志文件，保留最新的max_files个"""
-        logs = await self.get_task_logs(task_id)
+        # 只查询需要删除的日志（跳过最新的max_files个）的ID和路径
+        result = await self.db.execute(
+            select(TaskLog.id, TaskLog.log_file_path)
+            .where(TaskLog.task_id == task_id)
+            .order_by(TaskLog.created_at.desc(), TaskLog.id.desc())
+            .offset(max_files)
+        )
+        logs_to_delete = result.all()
         
-        if len(logs) > max_files:
-            # 删除多余的日志记录和文件
-            logs_to_delete = logs[max_files:]
+        if logs_to_delete:
+            # 并发删除文件，删除失败只记录日志，不影响数据库记录的清理
+            log_file_paths = [log_file_path for _, log_file_path in logs_to_delete if log_file_path]
+            results = await asyncio.gather(
+                *[asyncio.to_thread(_remove_log_file, log_file_path) for log_file_path in log_file_paths],
+                return_exceptions=True
+            )
+            for log_file_path, error in zip(log_file_paths, results):
+                if isinstance(error, Exception):
+                    logger.warning(f"删除日志文件失败 {log_file_path}: {str(error)}")
             
-            for log in logs_to_delete:
-                # 删除文件
-                if os.path.exists(log.log_file_path):
-                    try:
-                        os.remove(log.log_file_path)
-                    except Exception:
-                        pass  # 忽略删除文件的错误
-                
-                # 删除数据库记录
-                await self.db.execute(
-                    delete(TaskLog).where(TaskLog.id == log.id)
+            # 一条语句批量删除数据库记录
+            await self.db.execute(
+                delete(TaskLog).where(
+                    TaskLog.task_id == task_id,
+                    TaskLog.id.in_([log_id for log_id, _ in logs_to_delete])
                 )
-            
+            )
             await self.db.commit()
     
-    async def end_log_entry(self, log_id: int):
-        """结束日志记录"""
-        log_entry = await self.db.execute(
-            select(TaskLog).where(TaskLog.id == log_id)
+    async def end_log_entry(self, log_id: int, commit: bool = True):
+        """结束日志记录（commit=False时不提交，由调用方统一提交事务）"""
+        await self.db.execute(
+            update(TaskLog).where(TaskLog.id == log_id).values(end_time=func.now())
         )
-        log_entry = log_entry.scalar_one_or_none()
-        
-        if log_entry:
-            log_entry.end_time = datetime.utcnow()
+        if commit:
             await self.db.commit()
     
+    async def rotate_log_entry(self, task_id: int, log_entry_id: int, new_log_path: str, log_date: date, part_num: int) -> TaskLog:
+        """结束当前日志记录并创建新的日志记录（UPDATE + INSERT ... RETURNING，同一事务提交）"""
+        await self.db.execute(
+            update(TaskLog).where(TaskLog.id == log_entry_id).values(end_time=func.now())
+        )
+        result = await self.db.execute(
+            insert(TaskLog)
+            .values(
+                task_id=task_id,
+                log_file_path=new_log_path,
+                log_date=log_date,
+                part_num=part_num
+            )
+            .returning(TaskLog)
+        )
+        new_log_entry = result.scalar_one()
+        await self.db.commit()
+        return new_log_entry
+    
     def generate_log_file_path(self, task_id: int, task_name: str, log_date: Optional[date] = None, part: int = 1) -> str:
         """生成日志文件路径
         
@@ -257,8 +413,7 @@ class LogService:
         
         date_str = log_date.strftime("%Y%m%d")
         timestamp = datetime.now().strftime("%H%M%S")
-        safe_task_name = "".join(c for c in task_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_task_name = safe_task_name.replace(' ', '_')
+        safe_task_name = _SAFE_RE.sub('', task_name).rstrip().replace(' ', '_')
         
         if part > 1:
             filename = f"task_{task_id}_{safe_task_name}_{date_str}_{timestamp}_part{part}.txt"
@@ -266,13 +421,18 @@ class LogService:
             filename = f"task_{task_id}_{safe_task_name}_{date_str}_{timestamp}.txt"
         return os.path.join(self.log_dir, filename)
     
-    async def check_and_rotate_log(self, task_id: int, current_log_path: str, log_entry_id: int) -> Optional[Tuple[str, str]]:
+    async def check_and_rotate_log(self, task: Task, current_log_path: str, log_entry_id: int) -> Optional[Tuple[str, str]]:
         """检查并轮换日志文件
         
         检查条件：
         1. 如果当前日期与日志文件日期不同（跨天），创建新日志文件
         2. 如果日志文件超过50000行，创建新日志文件
         
+        Args:
+            task: 任务对象（由调用方传入，避免重复查询任务）
+            current_log_path: 当前日志文件路径
+            log_entry_id: 当前日志记录ID
+        
         Returns:
             如果需要切换，返回新日志文件路径；否则返回None
         """
@@ -280,93 +440,44 @@ class LogService:
             return None
         
         try:
-            # 检查文件行数
-            line_count = 0
-            async with aiofiles.open(current_log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                async for _ in f:
-                    line_count += 1
-                    if line_count > 50000:
-                        break
-            
             # 检查是否需要切换
             need_rotate = False
             rotate_reason = ""
             
-            # 检查行数
-            if line_count > 50000:
+            # 检查行数：先用文件大小和内存计数预检查，可能超限时才精确统计
+            st = await _run_log_io(os.stat, current_log_path)
+            line_count = _line_counts.get(current_log_path, 0)
+            if st.st_size >= ROTATE_SIZE_BYTES or line_count >= MAX_LOG_LINES:
+                line_count = await _run_log_io(_fast_linecount, current_log_path, MAX_LOG_LINES + 1)
+                _line_counts[current_log_path] = line_count
+            
+            if line_count > MAX_LOG_LINES:
                 need_rotate = True
-                rotate_reason = f"行数超过50000行（当前{line_count}行）"
+                rotate_reason = f"行数超过{MAX_LOG_LINES}行（当前{line_count}行）"
             
-            # 检查日期（从文件名中提取日期）
-            try:
-                filename = os.path.basename(current_log_path)
-                # 文件名格式: task_{task_id}_{task_name}_{date}_{time}[_part{N}].txt
-                parts = filename.replace('.txt', '').split('_')
-                if len(parts) >= 4:
-                    # 查找日期部分（格式：YYYYMMDD）
-                    file_date_str = None
-                    for part in parts:
-                        if len(part) == 8 and part.isdigit():
-                            file_date_str = part
-                            break
-                    
-                    if file_date_str:
-                        file_date = datetime.strptime(file_date_str, "%Y%m%d").date()
-                        current_date = datetime.now().date()
-                        
-                        if file_date < current_date:
-                            need_rotate = True
-                            rotate_reason = f"跨天（文件日期：{file_date}，当前日期：{current_date}）"
-            except Exception as e:
-                # 如果无法解析日期，忽略
-                pass
+            # 检查日期（使用日志记录中保存的日期）
+            current_date = datetime.now().date()
+            file_date = (await self.db.execute(
+                select(TaskLog.log_date).where(TaskLog.id == log_entry_id)
+            )).scalar_one_or_none()
+            if file_date and file_date < current_date:
+                need_rotate = True
+                rotate_reason = f"跨天（文件日期：{file_date}，当前日期：{current_date}）"
             
             if need_rotate:
-                # 获取任务信息以生成新日志文件名
-                from services.task_service import TaskService
-                task_service = TaskService(self.db)
-                task = await task_service.get_task(task_id)
-                
-                if not task:
-                    return None
-                
-                # 确定新日志文件的日期和部分号
-                current_date = datetime.now().date()
+                task_id = task.id
                 
-                # 检查今天是否已有日志文件
-                today_logs = await self.get_task_logs(task_id)
-                today_log_count = 0
-                for log in today_logs:
-                    if log.log_file_path and os.path.exists(log.log_file_path):
-                        try:
-                            log_filename = os.path.basename(log.log_file_path)
-                            log_parts = log_filename.replace('.txt', '').split('_')
-                            for part in log_parts:
-                                if len(part) == 8 and part.isdigit():
-                                    log_date_str = part
-                                    log_date = datetime.strptime(log_date_str, "%Y%m%d").date()
-                                    if log_date == current_date:
-                                        # 检查是否是part文件
-                                        if '_part' in log_filename:
-                                            try:
-                                                part_num = int(log_filename.split('_part')[1].replace('.txt', ''))
-                                                today_log_count = max(today_log_count, part_num)
-                                            except:
-                                                pass
-                                        else:
-                                            today_log_count = max(today_log_count, 1)
-                        except:
-                            pass
-                
-                # 生成新日志文件路径
-                new_part = today_log_count + 1
+                # 确定新日志文件的部分号（今天已有日志文件的最大部分号 + 1）
+                max_part = (await self.db.execute(
+                    select(func.max(TaskLog.part_num))
+                    .where(TaskLog.task_id == task_id, TaskLog.log_date == current_date)
+                )).scalar()
+                new_part = (max_part or 0) + 1
                 new_log_path = self.generate_log_file_path(task_id, task.name, current_date, new_part)
                 
-                # 结束当前日志记录
-                await self.end_log_entry(log_entry_id)
-                
-                # 创建新的日志记录
-                new_log_entry = await self.create_log_entry(task_id, new_log_path)
+                # 结束当前日志记录并创建新的日志记录
+                _line_counts.pop(current_log_path, None)
+                await self.rotate_log_entry(task_id, log_entry_id, new_log_path, current_date, new_part)
                 
                 logger.info(f"任务 {task_id} 日志文件轮换：{rotate_reason}，新日志文件：{new_log_path}")
                 
@@ -379,32 +490,10 @@ class LogService:
         
         return None
     
-    def get_log_file_info(self, log_file_path: str) -> Tuple[Optional[date], int]:
+    def get_log_file_info(self, log_entry: TaskLog) -> Tuple[Optional[date], int]:
         """获取日志文件信息
         
         Returns:
             (文件日期, 部分号)
         """
-        try:
-            filename = os.path.basename(log_file_path)
-            parts = filename.replace('.txt', '').split('_')
-            
-            file_date = None
-            part_num = 1
-            
-            # 查找日期部分
-            for part in parts:
-                if len(part) == 8 and part.isdigit():
-                    file_date = datetime.strptime(part, "%Y%m%d").date()
-                    break
-            
-            # 查找部分号
-            if '_part' in filename:
-                try:
-                    part_num = int(filename.split('_part')[1].replace('.txt', ''))
-                except:
-                    pass
-            
-            return file_date, part_num
-        except:
-            return None, 1
\ No newline at end of file
+        return log_entry.log_date, log_entry.part_num or 1
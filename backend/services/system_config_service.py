@@ -1,30 +1,61 @@
 """
 系统配置服务
 """
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import Optional, List
+from sqlalchemy import select, bindparam, lambda_stmt
+from typing import AsyncIterator, Dict, Optional, Tuple
 from models.system_config import SystemConfig
 from schemas.system_config import SystemConfigCreate, SystemConfigUpdate
 
 
+# 配置值缓存有效期（秒）
+CONFIG_CACHE_TTL = 30.0
+# 流式读取全部配置时每批缓冲的行数
+CONFIG_STREAM_BATCH_SIZE = 500
+
+# 预构建的热点查询语句（lambda_stmt缓存语句结构，调用时只传入绑定参数）
+_GET_CONFIG_STMT = lambda_stmt(lambda: select(SystemConfig).where(SystemConfig.key == bindparam('key')))
+
+# 缓存中表示配置不存在的哨兵对象（与配置存在但值为NULL区分）
+_MISSING = object()
+
+
 class SystemConfigService:
     """系统配置服务类"""
     
+    # 进程内配置值缓存：key -> (过期时间, 配置值)，配置不存在时缓存_MISSING
+    _cache: Dict[str, Tuple[float, object]] = {}
+    # 缓存版本号，每次修改配置时递增，避免并发读取把修改前的旧值写回缓存
+    _cache_version = 0
+    
     def __init__(self, db: AsyncSession):
         self.db = db
     
+    @classmethod
+    def _invalidate(cls, key: str):
+        """使配置值缓存失效"""
+        cls._cache.pop(key, None)
+        cls._cache_version += 1
+    
     async def get_config(self, key: str) -> Optional[SystemConfig]:
         """获取配置"""
-        result = await self.db.execute(
-            select(SystemConfig).where(SystemConfig.key == key)
-        )
+        result = await self.db.execute(_GET_CONFIG_STMT, {'key': key})
         return result.scalar_one_or_none()
     
     async def get_config_value(self, key: str, default: Optional[str] = None) -> Optional[str]:
-        """获取配置值"""
-        config = await self.get_config(key)
-        return config.value if config else default
+        """获取配置值（优先读取进程内缓存）"""
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            value = cached[1]
+        else:
+            version = SystemConfigService._cache_version
+            config = await self.get_config(key)
+            value = config.value if config else _MISSING
+            if version == SystemConfigService._cache_version:
+                self._cache[key] = (time.monotonic() + CONFIG_CACHE_TTL, value)
+        # 只有配置不存在时才返回默认值，配置存在但值为NULL时返回None
+        return default if value is _MISSING else value
     
     async def set_config(self, key: str, value: Optional[str], description: Optional[str] = None) -> SystemConfig:
         """设置配置（如果不存在则创建，存在则更新）"""
@@ -46,6 +77,7 @@ class SystemConfigService:
             self.db.add(config)
         
         await self.db.commit()
+        self._invalidate(key)
         await self.db.refresh(config)
         return config
     
@@ -58,6 +90,7 @@ class SystemConfigService:
         )
         self.db.add(config)
         await self.db.commit()
+        self._invalidate(config.key)
         await self.db.refresh(config)
         return config
     
@@ -73,6 +106,7 @@ class SystemConfigService:
             config.description = config_data.description
         
         await self.db.commit()
+        self._invalidate(key)
         await self.db.refresh(config)
         return config
     
@@ -84,10 +118,14 @@ class SystemConfigService:
         
         await self.db.delete(config)
         await self.db.commit()
+        self._invalidate(key)
         return True
     
-    async def get_all_configs(self) -> List[SystemConfig]:
-        """获取所有配置"""
-        result = await self.db.execute(select(SystemConfig))
-        return list(result.scalars().all())
+    async def get_all_configs(self) -> AsyncIterator[SystemConfig]:
+        """逐条获取所有配置（流式读取，每批缓冲CONFIG_STREAM_BATCH_SIZE行）"""
+        result = await self.db.stream_scalars(
+            select(SystemConfig).execution_options(yield_per=CONFIG_STREAM_BATCH_SIZE)
+        )
+        async for config in result:
+            yield config
 
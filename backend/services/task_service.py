@@ -2,14 +2,17 @@
 任务服务层
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func
+from sqlalchemy import select, update, delete, func, bindparam, lambda_stmt
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Tuple
 
-from models.task import Task, TaskStatus
+from core.events import task_events
+from models.task import Task, TaskStatus, RepeatType
 from schemas.task import TaskCreate, TaskUpdate
 
+# 预构建的热点查询语句（lambda_stmt缓存语句结构，调用时只传入绑定参数）
+_GET_TASK_STMT = lambda_stmt(lambda: select(Task).where(Task.id == bindparam('task_id')))
+
 
 class TaskService:
     """任务服务类"""
@@ -23,10 +26,10 @@ class TaskService:
             name=task_data.name,
             activate_env_command=task_data.activate_env_command,
             main_program_command=task_data.main_program_command,
-            repeat_type=task_data.repeat_type,
+            repeat_type=task_data.repeat_type.value,
             start_time=task_data.start_time,
             end_time=task_data.end_time,
-            status=TaskStatus.PENDING
+            status=TaskStatus.PENDING.value
         )
         
         self.db.add(task)
@@ -36,18 +39,40 @@ class TaskService:
     
     async def get_task(self, task_id: int) -> Optional[Task]:
         """根据ID获取任务"""
-        result = await self.db.execute(
-            select(Task).where(Task.id == task_id)
-        )
+        result = await self.db.execute(_GET_TASK_STMT, {'task_id': task_id})
         return result.scalar_one_or_none()
     
     async def get_tasks(self, skip: int = 0, limit: int = 100) -> List[Task]:
         """获取任务列表"""
         result = await self.db.execute(
-            select(Task).offset(skip).limit(limit).order_by(Task.created_at.desc())
+            select(Task).offset(skip).limit(limit).order_by(Task.created_at.desc(), Task.id.desc())
+        )
+        return result.scalars().all()
+    
+    async def get_tasks_with_logs(self, skip: int = 0, limit: Optional[int] = 100, status: Optional[TaskStatus] = None) -> List[Task]:
+        """获取任务列表并预加载日志（selectinload，所有任务的日志在一条IN查询中加载）"""
+        query = select(Task).options(selectinload(Task.logs))
+        if status is not None:
+            query = query.where(Task.status == status.value)
+        result = await self.db.execute(
+            query.offset(skip).limit(limit).order_by(Task.created_at.desc(), Task.id.desc())
         )
         return result.scalars().all()
     
+    async def get_tasks_page(self, skip: int = 0, limit: int = 100) -> Tuple[List[Task], int]:
+        """获取一页任务列表和任务总数（使用窗口函数在同一条查询中返回总数）"""
+        result = await self.db.execute(
+            select(Task, func.count().over().label('total'))
+            .offset(skip)
+            .limit(limit)
+            .order_by(Task.created_at.desc(), Task.id.desc())
+        )
+        rows = result.all()
+        if not rows:
+            # 页码超出范围时窗口函数没有返回行，单独查询总数
+            return [], (await self.get_tasks_count() if skip > 0 else 0)
+        return [task for task, _ in rows], rows[0].total
+    
     async def get_tasks_count(self) -> int:
         """获取任务总数"""
         result = await self.db.execute(
@@ -56,25 +81,30 @@ class TaskService:
         return result.scalar()
     
     async def update_task(self, task_id: int, task_data: TaskUpdate) -> Optional[Task]:
-        """更新任务"""
-        # 获取现有任务
-        task = await self.get_task(task_id)
-        if not task:
-            return None
-        
-        # 更新字段
+        """更新任务（UPDATE ... RETURNING 一次往返完成更新和读取）"""
         update_data = task_data.model_dump(exclude_unset=True)
-        if update_data:
-            update_data['updated_at'] = datetime.utcnow()
-            
-            await self.db.execute(
-                update(Task).where(Task.id == task_id).values(**update_data)
-            )
-            await self.db.commit()
-            
-            # 重新获取更新后的任务
-            task = await self.get_task(task_id)
+        if not update_data:
+            return await self.get_task(task_id)
+        
+        # 枚举字段以字符串形式存储
+        for field in ('repeat_type', 'status'):
+            if isinstance(update_data.get(field), (RepeatType, TaskStatus)):
+                update_data[field] = update_data[field].value
+        # 显式使用数据库时间，使RETURNING返回的对象也带上新的更新时间
+        update_data['updated_at'] = func.now()
         
+        result = await self.db.execute(
+            update(Task)
+            .where(Task.id == task_id)
+            .values(**update_data)
+            .returning(Task)
+            .execution_options(populate_existing=True)
+        )
+        task = result.scalar_one_or_none()
+        if task:
+            await self.db.commit()
+            if 'status' in update_data:
+                task_events.publish(task_id, task.status)
         return task
     
     async def delete_task(self, task_id: int) -> bool:
@@ -92,22 +122,21 @@ class TaskService:
     async def get_running_tasks(self) -> List[Task]:
         """获取正在运行的任务"""
         result = await self.db.execute(
-            select(Task).where(Task.status == TaskStatus.RUNNING)
+            select(Task).where(Task.status == TaskStatus.RUNNING.value)
         )
         return result.scalars().all()
     
     async def get_pending_tasks(self) -> List[Task]:
         """获取等待中的任务"""
         result = await self.db.execute(
-            select(Task).where(Task.status == TaskStatus.PENDING)
+            select(Task).where(Task.status == TaskStatus.PENDING.value)
         )
         return result.scalars().all()
     
-    async def update_task_status(self, task_id: int, status: TaskStatus, process_id: Optional[int] = None) -> bool:
-        """更新任务状态"""
+    async def update_task_status(self, task_id: int, status: TaskStatus, process_id: Optional[int] = None, commit: bool = True) -> bool:
+        """更新任务状态（commit=False时不提交，由调用方统一提交事务并发布状态变更事件）"""
         update_data = {
-            'status': status,
-            'updated_at': datetime.utcnow()
+            'status': status.value
         }
         
         if process_id is not None:
@@ -116,6 +145,10 @@ class TaskService:
         result = await self.db.execute(
             update(Task).where(Task.id == task_id).values(**update_data)
         )
-        await self.db.commit()
+        updated = result.rowcount > 0
+        if commit:
+            await self.db.commit()
+            if updated:
+                task_events.publish(task_id, status.value)
         
-        return result.rowcount > 0
\ No newline at end of file
+        return updated
\ No newline at end of file
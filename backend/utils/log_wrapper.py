@@ -5,21 +5,39 @@
 用于包装任务命令，实现日志文件的自动轮转
 支持：
 1. 按日期轮转（跨天时自动切换）
-2. 按行数轮转（超过50000行自动切换）
+2. 按大小轮转（超过8MB自动切换）
 """
 import sys
 import os
+import platform
+import traceback
 import subprocess
 import signal
 import time
+import queue
+import shlex
+import selectors
 from datetime import datetime, date
 from pathlib import Path
 import threading
 
 # ==================== 配置区域 ====================
 # 日志文件配置
-MAX_LINES_PER_FILE = 50000
-CHECK_INTERVAL = 60  # 检查间隔（秒）
+MAX_BYTES_PER_FILE = 8 * 1024 * 1024  # 单个日志文件最大字节数（约5万行普通日志）
+CHECK_INTERVAL = 60  # 日期变更（跨天轮转）检查间隔（秒）
+WRITE_BUFFER_SIZE = 65536  # 日志文件写缓冲大小（字节），缓冲满即写入文件
+FLUSH_INTERVAL = 1.0  # 缓冲数据最长滞留时间（秒），保证实时日志查看的延迟
+READ_BLOCK_SIZE = 65536  # 每次从子进程管道读取的最大字节数
+READ_POLL_INTERVAL = 1.0  # 等待管道数据的超时时间（秒），超时后检查子进程状态和停止信号
+SHUTDOWN_DRAIN_TIMEOUT = 3.0  # 收到停止信号后，等待子进程退出并读完剩余输出的最长时间（秒）
+WRITE_QUEUE_SIZE = 1024  # 待写入数据块队列长度（读管道线程与写文件线程之间的缓冲）
+WRITE_QUEUE_TIMEOUT = 5.0  # 队列满时写入方最长等待时间（秒），超时则丢弃该数据块
+DRAIN_BATCH_SIZE = 64  # 后台写线程单次合并写入的最大数据块数
+# 直通模式开关（环境变量设置为1启用）：子进程输出直接写入日志文件，不经过本脚本转发。
+# 适合输出量很大的任务；代价是本次运行期间不再按大小/日期轮转日志文件
+PASSTHROUGH_ENV = 'LOG_WRAPPER_PASSTHROUGH'
+# 命令中出现这些字符时需要shell解释，直通模式下仍通过shell执行
+SHELL_METACHARS = frozenset('|&;<>()$`\\*?[]{}~#=%!\n')
 
 # Windows conda 路径配置
 # 如果环境变量找不到 conda，可以在这里手动配置 conda 路径
@@ -51,6 +69,77 @@ except NameError:
 # ==================================================
 
 
+# fallocate的FALLOC_FL_KEEP_SIZE标志（linux/falloc.h）
+FALLOC_FL_KEEP_SIZE = 0x01
+
+# 通知后台写线程退出的哨兵对象
+_STOP = object()
+# 通知后台写线程轮转日志文件的控制项（splice在读管道线程中发现需要轮转时使用）
+_ROTATE = object()
+
+
+def _load_fallocate():
+    """加载Linux libc的fallocate函数，不可用时返回None
+
+    os.posix_fallocate会把文件大小扩展到预分配长度，而日志文件以O_APPEND追加写入、
+    且被实时读取，因此只能使用带FALLOC_FL_KEEP_SIZE标志的fallocate（只分配磁盘空间，不改变文件大小）
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        func = getattr(libc, 'fallocate64', None) or libc.fallocate
+        func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+        func.restype = ctypes.c_int
+        return func
+    except (OSError, AttributeError):
+        return None
+
+
+_fallocate = _load_fallocate()
+
+
+def _preallocate(fd: int, size: int):
+    """为日志文件预分配磁盘空间，避免持续追加时反复分配extent（失败时忽略）"""
+    if _fallocate is not None:
+        _fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size)
+
+
+def _release_preallocation(fd: int):
+    """把文件截断到实际大小，释放未用完的预分配空间"""
+    if _fallocate is not None:
+        try:
+            os.ftruncate(fd, os.fstat(fd).st_size)
+        except OSError:
+            pass
+
+
+def _format_date(d: date) -> str:
+    """日期格式化为YYYYMMDD"""
+    return f"{d.year:04d}{d.month:02d}{d.day:02d}"
+
+
+def _open_append(path: str) -> int:
+    """以追加方式打开（不存在则创建）日志文件，返回文件描述符"""
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    return os.open(path, flags, 0o644)
+
+
+def _drop_page_cache(fd: int):
+    """落盘后建议内核丢弃文件的页缓存（仅支持posix_fadvise的平台，如Linux）"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        # DONTNEED只会丢弃干净页，先把脏页写回
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+
 class LogRotator:
     """日志轮转器"""
     
@@ -58,39 +147,77 @@ class LogRotator:
         self.log_dir = Path(log_dir)
         self.task_id = task_id
         self.task_name = task_name
+        # 任务名不变，文件名中使用的安全任务名和匹配前缀只计算一次
+        safe_task_name = "".join(c for c in task_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        self._safe_task_name = safe_task_name.replace(' ', '_')
+        self._glob_prefix = f"task_{task_id}_"
         self.current_log_path = None
-        self.current_log_file = None
-        self.line_count = 0
+        # 日志文件以O_APPEND打开，通过os.write直接写入，由_buf做进程内缓冲
+        self._fd = None
+        self._buf = bytearray()
+        # splice零拷贝写入用的描述符（splice不支持O_APPEND，需单独打开并指定写入偏移）
+        self._splice_fd = None
+        # 后台写线程与splice（在读管道线程中执行）之间互斥访问日志文件
+        self._io_lock = threading.Lock()
+        # 当前日志文件已写入的字节数（按大小轮转，无需逐块统计换行符）
+        self._bytes = 0
         self.log_date = None
+        # 文件名中日期部分（YYYYMMDD）的缓存及其对应日期
+        self._date_str = None
+        self._date_str_date = None
+        # 当天下一个日志文件的部分号（本轮转器是唯一写入方，无需每次扫描目录）
+        self._next_part = 1
         self.running = True
+        # 上次把缓冲写入文件的时间，缓冲数据最多滞留FLUSH_INTERVAL
+        self._last_flush = time.monotonic()
+        # 缓存当天日期，每CHECK_INTERVAL秒刷新一次，避免每次写入都获取当前时间
+        self._today = date.today()
+        self._last_date_check = self._last_flush
+        # write()只把数据放入队列，由后台线程合并写盘，读管道的线程不会被磁盘I/O阻塞
+        self.q = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.dropped = 0
+        # 丢弃后尚未在日志文件中记录的数据块数
+        self._unreported_drops = 0
+        # 直通模式下子进程直接写当前文件，不能再轮转
+        self._rotation_enabled = True
+        # 已向后台写线程提交轮转请求、尚未处理
+        self._rotate_pending = False
+        # 轮转出去、等待收尾（释放预分配空间、丢弃页缓存、关闭）的旧文件描述符
+        self._retired_fds = []
+        # 停止信号标志：信号处理函数只设置该标志，由主循环负责终止子进程并收尾
+        self._shutdown = threading.Event()
         
         # 确保日志目录存在
         self.log_dir.mkdir(parents=True, exist_ok=True)
         
-        # 创建初始日志文件
-        self._create_new_log_file()
+        # 打开初始日志文件
+        self._open_initial_log_file()
+        
+        # 后台写线程：日志文件（包括轮转）只在该线程中操作
+        self._drain_thread = threading.Thread(target=self._drain, daemon=True)
+        self._drain_thread.start()
     
-    def _generate_log_filename(self, log_date: date = None, part: int = 1) -> str:
+    def _generate_log_filename(self, log_date: date, part: int = 1) -> str:
         """生成日志文件名"""
-        if log_date is None:
-            log_date = datetime.now().date()
-        
-        date_str = log_date.strftime("%Y%m%d")
-        time_str = datetime.now().strftime("%H%M%S")
-        safe_task_name = "".join(c for c in self.task_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_task_name = safe_task_name.replace(' ', '_')
+        # 日期部分按log_date缓存，时间部分直接由localtime拼接（比strftime快）
+        if log_date != self._date_str_date:
+            self._date_str = _format_date(log_date)
+            self._date_str_date = log_date
+        date_str = self._date_str
+        t = time.localtime()
+        time_str = f"{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
         
         if part > 1:
-            filename = f"task_{self.task_id}_{safe_task_name}_{date_str}_{time_str}_part{part}.txt"
+            filename = f"{self._glob_prefix}{self._safe_task_name}_{date_str}_{time_str}_part{part}.txt"
         else:
-            filename = f"task_{self.task_id}_{safe_task_name}_{date_str}_{time_str}.txt"
+            filename = f"{self._glob_prefix}{self._safe_task_name}_{date_str}_{time_str}.txt"
         
         return str(self.log_dir / filename)
     
     def _get_current_part_number(self, log_date: date) -> int:
         """获取当前日期的日志文件部分号"""
         part = 1
-        for log_file in self.log_dir.glob(f"task_{self.task_id}_*_{log_date.strftime('%Y%m%d')}_*.txt"):
+        for log_file in self.log_dir.glob(f"{self._glob_prefix}*_{_format_date(log_date)}_*.txt"):
             filename = log_file.name
             if '_part' in filename:
                 try:
@@ -102,125 +229,345 @@ class LogRotator:
                 part = max(part, 2)  # 如果已有非part文件，下一个从part2开始
         return part
     
-    def _create_new_log_file(self):
-        """创建新的日志文件"""
-        # 关闭旧文件
-        if self.current_log_file:
-            try:
-                self.current_log_file.flush()
-                self.current_log_file.close()
-            except:
-                pass
+    def _find_reusable_log_file(self, current_date: date):
+        """查找今天创建的、匹配task_id和task_name的日志文件（可能由scheduler预创建），没有则返回None"""
+        date_str = _format_date(current_date)
+        name_prefix = f"{self._glob_prefix}{self._safe_task_name}_{date_str}_"
+        
+        # 单次扫描目录，取修改时间最新的匹配文件（DirEntry自带stat缓存）
+        existing_file = None
+        existing_mtime = 0.0
+        with os.scandir(self.log_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not (name.startswith(name_prefix) and name.endswith('.txt')):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if existing_file is None or mtime > existing_mtime:
+                    existing_file = entry.path
+                    existing_mtime = mtime
         
-        # 确定新日志文件的日期和部分号
+        # 如果文件存在且是今天修改过的，使用它
+        if existing_file is not None and datetime.fromtimestamp(existing_mtime).date() == current_date:
+            return existing_file
+        return None
+    
+    def _open_initial_log_file(self):
+        """首次打开日志文件：优先沿用今天已有的匹配日志文件，否则创建新文件"""
         current_date = datetime.now().date()
+        existing_file = self._find_reusable_log_file(current_date)
+        if existing_file is not None:
+            # 打开现有文件（追加模式）
+            try:
+                self._fd = _open_append(existing_file)
+                self.current_log_path = existing_file
+                self.log_date = current_date
+                # 已有内容大小直接取文件大小，无需读取文件
+                self._bytes = os.fstat(self._fd).st_size
+                # 写入标记，表示log_wrapper已接管
+                self._write_text(f"\n[日志包装器接管] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - log_wrapper已接管日志记录\n")
+                self._flush_buffer()
+                # 沿用已有文件时，只在此处扫描一次目录确定后续部分号
+                self._next_part = self._get_current_part_number(current_date)
+                return
+            except Exception as e:
+                # 如果打开失败，继续创建新文件
+                self._close_fd()
+                print(f"WARNING: Failed to reuse existing log file {existing_file}: {str(e)}", file=sys.stderr)
         
-        # 检查是否需要切换日期
-        if self.log_date and self.log_date < current_date:
-            # 跨天了，创建新日期的日志文件
-            new_part = 1
+        self._create_new_log_file()
+    
+    def _next_path(self, current_date: date):
+        """确定下一个日志文件的路径和部分号：首次创建或跨天时从部分1开始，同一天内部分号递增"""
+        if self.log_date is None or self.log_date < current_date:
             self.log_date = current_date
-        elif self.log_date == current_date:
-            # 同一天，但需要拆分（行数超限）
-            new_part = self._get_current_part_number(current_date)
+            part = 1
         else:
-            # 首次创建：检查是否已有今天创建的匹配日志文件（可能由scheduler预创建）
-            self.log_date = current_date
-            new_part = 1
-            
-            # 查找今天创建的、匹配task_id和task_name的日志文件
-            safe_task_name = "".join(c for c in self.task_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            safe_task_name = safe_task_name.replace(' ', '_')
-            date_str = current_date.strftime("%Y%m%d")
-            pattern = f"task_{self.task_id}_{safe_task_name}_{date_str}_*.txt"
-            
-            # 查找匹配的日志文件，按修改时间排序，使用最新的
-            matching_files = list(self.log_dir.glob(pattern))
-            if matching_files:
-                # 按修改时间排序，使用最新的
-                matching_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-                existing_file = matching_files[0]
-                # 如果文件存在且是今天创建的，使用它
-                file_date = datetime.fromtimestamp(existing_file.stat().st_mtime).date()
-                if file_date == current_date:
-                    self.current_log_path = str(existing_file)
-                    # 打开现有文件（追加模式）
-                    try:
-                        self.current_log_file = open(self.current_log_path, 'a', encoding='utf-8')
-                        # 统计已有行数
-                        self.line_count = sum(1 for _ in open(self.current_log_path, 'r', encoding='utf-8'))
-                        # 写入标记，表示log_wrapper已接管
-                        self.current_log_file.write(f"\n[日志包装器接管] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - log_wrapper已接管日志记录\n")
-                        self.current_log_file.flush()
-                        return
-                    except Exception as e:
-                        # 如果打开失败，继续创建新文件
-                        print(f"WARNING: Failed to reuse existing log file {existing_file}: {str(e)}", file=sys.stderr)
+            part = self._next_part
+        self._next_part = part + 1
+        return self._generate_log_filename(self.log_date, part), part
+    
+    def _create_new_log_file(self):
+        """创建新的日志文件：关闭旧文件，确定新路径，打开新文件并写入文件头"""
+        # 关闭旧文件：收尾操作（fdatasync等）较慢，留到释放_io_lock后由_finish_retired_files完成
+        if self._fd is not None:
+            try:
+                self._flush_buffer()
+            except:
+                pass
+            self._retired_fds.append(self._fd)
+            self._fd = None
+            self._close_fd()
         
         # 生成新日志文件路径
-        self.current_log_path = self._generate_log_filename(self.log_date, new_part)
+        self.current_log_path, new_part = self._next_path(datetime.now().date())
         
         try:
             # 确保目录存在
             os.makedirs(os.path.dirname(self.current_log_path), exist_ok=True)
             
             # 打开新日志文件（追加模式，如果不存在则创建）
-            self.current_log_file = open(self.current_log_path, 'a', encoding='utf-8')
-            self.line_count = 0
+            self._fd = _open_append(self.current_log_path)
+            self._bytes = 0
+            _preallocate(self._fd, MAX_BYTES_PER_FILE)
             
-            # 写入启动标记（确保文件被创建）
-            start_marker = f"[任务启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 任务ID: {self.task_id}, 任务名称: {self.task_name}\n"
-            self.current_log_file.write(start_marker)
-            self.current_log_file.flush()
-            
-            # 写入轮换标记（如果不是首次创建）
-            if self.log_date and new_part > 1:
-                self.current_log_file.write(
-                    f"[日志文件轮换] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - "
-                    f"创建新日志文件（部分 {new_part}）\n\n"
-                )
-                self.current_log_file.flush()
+            # 文件头：启动标记 + 轮换标记（如果不是首次创建）；只写入缓冲，随后续数据一起写盘
+            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            header = f"[任务启动] {now_str} - 任务ID: {self.task_id}, 任务名称: {self.task_name}\n"
+            if new_part > 1:
+                header += f"[日志文件轮换] {now_str} - 创建新日志文件（部分 {new_part}）\n\n"
+            self._write_text(header)
         except Exception as e:
             # 如果创建文件失败，输出错误到stderr
             print(f"ERROR: Failed to create log file {self.current_log_path}: {str(e)}", file=sys.stderr)
             raise
     
-    def write(self, data: str):
-        """写入日志数据"""
-        if not self.current_log_file:
+    def write(self, data: bytes):
+        """写入日志数据（放入队列，由后台线程写盘）"""
+        if not self.running:
+            return
+        if self._unreported_drops:
+            # 之前丢弃过数据：队列有空位时先写入丢弃标记，在日志中记录缺失的位置；
+            # 队列仍满则直接丢弃，不再每块等待WRITE_QUEUE_TIMEOUT
+            try:
+                self.q.put_nowait(self._drop_marker())
+                self._unreported_drops = 0
+            except queue.Full:
+                self.dropped += 1
+                self._unreported_drops += 1
+                return
+        try:
+            self.q.put(data, timeout=WRITE_QUEUE_TIMEOUT)
+        except queue.Full:
+            # 磁盘长时间阻塞，丢弃该数据块，避免反压导致子进程阻塞在管道写入上
+            self.dropped += 1
+            self._unreported_drops += 1
+    
+    def _drop_marker(self) -> bytes:
+        """生成丢弃标记（记录此前连续丢弃的数据块数）"""
+        return (
+            f"\n[日志丢弃] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - "
+            f"写入阻塞，此处丢弃了 {self._unreported_drops} 个输出数据块\n"
+        ).encode('utf-8')
+    
+    def write_text(self, text: str):
+        """写入文本日志（如启动/结束标记），按UTF-8编码"""
+        self.write(text.encode('utf-8'))
+    
+    def _drain(self):
+        """后台写线程：从队列批量取出数据，合并后一次写入"""
+        while True:
+            try:
+                data = self.q.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                # 空闲时把缓冲中的数据落盘，保证实时日志查看的延迟
+                self._safe_flush()
+                continue
+            
+            # 合并连续的数据块；遇到控制项（退出哨兵/同步事件）时先写出已合并的数据
+            batch = []
+            while isinstance(data, bytes):
+                batch.append(data)
+                if len(batch) >= DRAIN_BATCH_SIZE:
+                    data = None
+                    break
+                try:
+                    data = self.q.get_nowait()
+                except queue.Empty:
+                    data = None
+                    break
+            
+            if batch:
+                try:
+                    with self._io_lock:
+                        self._write_batch(b''.join(batch))
+                except Exception as e:
+                    print(f"ERROR: Failed to write log file {self.current_log_path}: {str(e)}", file=sys.stderr)
+            
+            if data is _ROTATE:
+                try:
+                    with self._io_lock:
+                        self._rotate_pending = False
+                        self._check_rotate(time.monotonic())
+                except Exception as e:
+                    print(f"ERROR: Failed to rotate log file {self.current_log_path}: {str(e)}", file=sys.stderr)
+                data = None
+            # 轮转出去的旧文件在锁外收尾，不阻塞splice
+            self._finish_retired_files()
+            
+            if data is _STOP:
+                break
+            if data is not None:
+                # 同步事件：此前的数据已全部写入，落盘后通知等待方
+                self._safe_flush()
+                data.set()
+    
+    def _write_bytes(self, data: bytes):
+        """写入进程内缓冲，缓冲满时写入文件；累计已写入字节数"""
+        self._buf += data
+        self._bytes += len(data)
+        if len(self._buf) >= WRITE_BUFFER_SIZE:
+            self._flush_buffer()
+    
+    def _write_text(self, text: str):
+        """编码并写入当前日志文件"""
+        self._write_bytes(text.encode('utf-8'))
+    
+    def _flush_buffer(self):
+        """把进程内缓冲全部写入文件（O_APPEND保证追加写入，处理部分写入）"""
+        if self._buf:
+            view = memoryview(self._buf)
+            try:
+                while view:
+                    written = os.write(self._fd, view)
+                    view = view[written:]
+            finally:
+                view.release()
+            self._buf.clear()
+        self._last_flush = time.monotonic()
+    
+    def _finish_retired_files(self):
+        """旧文件收尾：释放预分配空间，通知内核释放其页缓存（不会再被本进程读写）并关闭"""
+        while self._retired_fds:
+            fd = self._retired_fds.pop()
+            try:
+                _release_preallocation(fd)
+                _drop_page_cache(fd)
+            except OSError:
+                pass
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+    
+    def _close_fd(self):
+        """关闭当前日志文件描述符"""
+        for fd in (self._fd, self._splice_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._fd = None
+        self._splice_fd = None
+    
+    def _write_batch(self, data: bytes):
+        """写入一批日志数据并检查是否需要轮转（仅在后台写线程中调用）"""
+        if self._fd is None:
             self._create_new_log_file()
         
         # 写入数据
-        self.current_log_file.write(data)
-        self.current_log_file.flush()
-        
-        # 统计行数
-        self.line_count += data.count('\n')
-        
-        # 检查是否需要轮转
-        current_date = datetime.now().date()
-        need_rotate = False
-        
-        # 检查行数
-        if self.line_count > MAX_LINES_PER_FILE:
-            need_rotate = True
+        self._write_bytes(data)
+        now = time.monotonic()
+        if now - self._last_flush >= FLUSH_INTERVAL:
+            self._flush_buffer()
+        self._check_rotate(now)
+    
+    def _need_rotate(self, now: float) -> bool:
+        """按文件大小/日期检查是否需要轮转"""
+        if now - self._last_date_check >= CHECK_INTERVAL:
+            self._today = date.today()
+            self._last_date_check = now
+        if not self._rotation_enabled:
+            return False
         
-        # 检查日期
-        if self.log_date and self.log_date < current_date:
-            need_rotate = True
+        # 检查文件大小
+        if self._bytes > MAX_BYTES_PER_FILE:
+            return True
         
-        if need_rotate:
+        # 检查日期（最多延迟CHECK_INTERVAL秒发现跨天）
+        return bool(self.log_date and self.log_date < self._today)
+    
+    def _check_rotate(self, now: float):
+        """需要轮转则切换到新文件（仅在后台写线程中调用）"""
+        if self._need_rotate(now):
             self._create_new_log_file()
     
+    def splice(self, src_fd: int) -> int:
+        """把管道中的数据直接移入日志文件（内核内拷贝，不经过用户态），返回移动的字节数，0表示EOF
+
+        在读管道的线程中调用，调用前需先sync()使已提交的数据全部落盘；
+        需要轮转时只提交给后台写线程处理，不在读管道的线程中做文件切换和落盘
+        """
+        rotate = False
+        with self._io_lock:
+            if self._buf:
+                # 轮转后的文件头还在缓冲中，先写入
+                self._flush_buffer()
+            if self._splice_fd is None:
+                self._splice_fd = os.open(self.current_log_path, os.O_WRONLY)
+            # 调度器等其他进程也可能追加写入同一文件，每次按文件当前大小确定写入偏移
+            offset = os.fstat(self._splice_fd).st_size
+            moved = os.splice(src_fd, self._splice_fd, READ_BLOCK_SIZE,
+                              offset_dst=offset, flags=os.SPLICE_F_MOVE)
+            if moved:
+                self._bytes = offset + moved
+                if not self._rotate_pending and self._need_rotate(time.monotonic()):
+                    self._rotate_pending = rotate = True
+        if rotate:
+            self.q.put(_ROTATE)
+        return moved
+    
+    def sync(self) -> bool:
+        """等待已提交的数据全部写入并刷新到文件，最多等待SHUTDOWN_DRAIN_TIMEOUT，返回是否完成"""
+        if not self.running or not self._drain_thread.is_alive():
+            return False
+        synced = threading.Event()
+        try:
+            self.q.put(synced, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        except queue.Full:
+            return False
+        if not synced.wait(SHUTDOWN_DRAIN_TIMEOUT):
+            print("WARNING: Timed out waiting for the log writer thread", file=sys.stderr)
+            return False
+        return True
+    
+    def begin_passthrough(self) -> int:
+        """进入直通模式：等待已提交的数据写入文件并停止轮转，返回供子进程直接写入的文件描述符"""
+        self.sync()
+        self._rotation_enabled = False
+        # 文件以追加模式打开（O_APPEND），子进程与本进程的写入不会互相覆盖
+        return self._fd
+    
+    def _safe_flush(self):
+        """刷新写缓冲，忽略异常（后台写线程空闲时调用）"""
+        try:
+            with self._io_lock:
+                if self._fd is not None:
+                    self._flush_buffer()
+        except Exception:
+            pass
+    
     def close(self):
-        """关闭日志文件"""
+        """关闭日志文件：通知后台写线程写完队列中剩余数据后退出，再关闭文件"""
+        if not self.running:
+            return
         self.running = False
-        if self.current_log_file:
+        self.q.put(_STOP)
+        self._drain_thread.join()
+        self._finish_retired_files()
+        if self.dropped:
+            print(f"WARNING: {self.dropped} log chunks dropped because the log file write was blocked", file=sys.stderr)
+        if self._fd is not None:
             try:
-                self.current_log_file.flush()
-                self.current_log_file.close()
+                if self._unreported_drops:
+                    self._write_bytes(self._drop_marker())
+                self._flush_buffer()
+                _release_preallocation(self._fd)
             except:
                 pass
+            self._close_fd()
+    
+    def request_shutdown(self):
+        """请求停止（可在信号处理函数中调用）"""
+        self._shutdown.set()
+    
+    def shutdown_requested(self) -> bool:
+        """是否已收到停止请求"""
+        return self._shutdown.is_set()
     
     def get_current_log_path(self) -> str:
         """获取当前日志文件路径"""
@@ -236,8 +583,6 @@ def _find_conda_base():
     3. 环境变量 CONDA_EXE（从中推导 base 路径）
     4. 从系统 PATH 中查找 conda 命令
     """
-    import platform
-    
     system = platform.system().lower()
     
     # Windows 优先：使用手动配置的路径
@@ -298,8 +643,6 @@ def _build_conda_init_command(command: str):
     在 Windows 上，如果命令包含 conda activate，需要先初始化 conda 环境。
     这样可以让 conda activate 在非交互式环境中正常工作。
     """
-    import platform
-    
     # 如果命令已经是 cmd /c "..." 格式，说明已经被 scheduler.py 处理过了
     # 不应该再包装，直接返回原命令
     if command.strip().startswith('cmd /c "'):
@@ -371,6 +714,40 @@ def _build_conda_init_command(command: str):
         return command
 
 
+def _split_simple_command(command: str):
+    """不含shell语法的简单命令拆分为参数列表（可不经shell直接执行），否则返回None"""
+    if any(c in SHELL_METACHARS for c in command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    return argv or None
+
+
+def _terminate_child(process):
+    """终止子进程（进程已退出时忽略）"""
+    try:
+        if process.poll() is None:
+            process.terminate()
+    except OSError:
+        pass
+
+
+def _wait_for_exit(process, rotator, deadline: float = None) -> int:
+    """等待子进程退出；收到停止请求时终止子进程，到达deadline仍未退出则强制结束"""
+    while True:
+        if deadline is None and rotator.shutdown_requested():
+            _terminate_child(process)
+            deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+        try:
+            return process.wait(timeout=READ_POLL_INTERVAL)
+        except subprocess.TimeoutExpired:
+            if deadline is not None and time.monotonic() >= deadline:
+                process.kill()
+                return process.wait()
+
+
 def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task_name: str):
     """运行命令并实现日志轮转"""
     try:
@@ -392,18 +769,23 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
         
     except Exception as e:
         print(f"ERROR: Failed to initialize log rotator: {str(e)}", file=sys.stderr)
-        import traceback
         print(traceback.format_exc(), file=sys.stderr)
         sys.exit(1)
     
     # 启动进程
     try:
-        import platform
-        
         # 检查命令中是否需要 conda，如果需要则初始化 conda
         actual_command = _build_conda_init_command(command)
         print(f"DEBUG: Final command after conda init: {actual_command}", file=sys.stderr)
         
+        # 直通模式：子进程的stdout/stderr直接指向日志文件，不再经过管道和本进程转发
+        passthrough = os.environ.get(PASSTHROUGH_ENV, '').strip() == '1'
+        if passthrough:
+            stdout_target = rotator.begin_passthrough()
+            print(f"DEBUG: Passthrough mode enabled, log rotation is disabled for this run", file=sys.stderr)
+        else:
+            stdout_target = subprocess.PIPE
+        
         if platform.system().lower() == 'windows':
             # Windows 上使用 cmd /c 执行命令
             # 检查命令是否已经包含 cmd /c，如果已经包含，直接使用；否则添加
@@ -414,34 +796,46 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
                 # 将命令用引号包裹，防止被拆分
                 cmd_line = f'cmd /c "{actual_command}"'
             
-            # 设置编码为UTF-8，并使用errors='replace'处理无法解码的字节
-            # 这样可以避免在Windows上因为进程输出UTF-8编码但系统默认GBK导致的解码错误
+            # 以二进制方式读取管道，输出原样写入日志文件（查看日志时再识别编码），
+            # 避免在Windows上因为进程输出UTF-8编码但系统默认GBK导致的解码错误
             process = subprocess.Popen(
                 cmd_line,
                 shell=True,  # 使用 shell
-                stdout=subprocess.PIPE,
+                stdout=stdout_target,
                 stderr=subprocess.STDOUT,
-                encoding='utf-8',  # 明确指定UTF-8编码
-                errors='replace',  # 遇到无法解码的字节时用替换字符代替，避免崩溃
-                bufsize=1  # 行缓冲
+                bufsize=READ_BLOCK_SIZE
             )
         else:
-            # Linux/Mac 使用 shell=True 执行
-            process = subprocess.Popen(
-                actual_command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                encoding='utf-8',  # 明确指定UTF-8编码
-                errors='replace',  # 遇到无法解码的字节时用替换字符代替，避免崩溃
-                bufsize=1  # 行缓冲
-            )
+            process = None
+            # 直通模式下简单命令直接exec，省去一个shell进程；失败时（如shell内置命令）回退到shell执行
+            argv = _split_simple_command(actual_command) if passthrough else None
+            if argv:
+                try:
+                    process = subprocess.Popen(
+                        argv,
+                        stdout=stdout_target,
+                        stderr=subprocess.STDOUT
+                    )
+                except OSError as e:
+                    print(f"DEBUG: Direct exec failed ({str(e)}), falling back to shell", file=sys.stderr)
+            if process is None:
+                # Linux/Mac 使用 shell=True 执行
+                process = subprocess.Popen(
+                    actual_command,
+                    shell=True,
+                    stdout=stdout_target,
+                    stderr=subprocess.STDOUT,
+                    bufsize=READ_BLOCK_SIZE
+                )
         
         # 写入启动信息到日志文件
         try:
-            rotator.write(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 命令: {command}\n")
-            rotator.write(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - PID: {process.pid}\n")
-            rotator.write(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 开始执行任务...\n\n")
+            rotator.write_text(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 命令: {command}\n")
+            rotator.write_text(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - PID: {process.pid}\n")
+            rotator.write_text(f"[进程启动] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 开始执行任务...\n\n")
+            if passthrough:
+                # 子进程直接写文件，启动信息需尽快落盘，避免排在子进程输出之后
+                rotator.sync()
         except:
             pass
         
@@ -449,29 +843,21 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
         # 如果进程启动失败，记录错误到日志文件
         error_msg = f"进程启动失败: {str(e)}"
         try:
-            rotator.write(f"\n[错误] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
-            import traceback
-            rotator.write(f"[错误堆栈]\n{traceback.format_exc()}\n")
+            rotator.write_text(f"\n[错误] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
+            rotator.write_text(f"[错误堆栈]\n{traceback.format_exc()}\n")
             rotator.close()
         except:
             pass
         print(f"ERROR: Failed to start process: {str(e)}", file=sys.stderr)
-        import traceback
         print(traceback.format_exc(), file=sys.stderr)
         sys.exit(1)
     
     def signal_handler(signum, frame):
-        """信号处理"""
-        rotator.close()
-        try:
-            process.terminate()
-            process.wait(timeout=5)
-        except:
-            try:
-                process.kill()
-            except:
-                pass
-        sys.exit(0)
+        """信号处理：只设置停止标志，由主循环终止子进程、读完剩余输出并关闭日志"""
+        rotator.request_shutdown()
+        if sys.platform == 'win32':
+            # Windows上读管道是阻塞的，先终止子进程使读取立即结束
+            _terminate_child(process)
     
     # 注册信号处理（Windows上可能不支持某些信号）
     try:
@@ -489,19 +875,20 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
         # 等待一小段时间，检查进程是否立即失败
         time.sleep(0.5)
         if process.poll() is not None:
-            # 进程已经结束，读取所有输出
+            # 进程已经结束，读取所有输出（直通模式下输出已直接写入日志文件）
             exit_code = process.returncode
-            remaining_output = process.stdout.read()
+            remaining_bytes = process.stdout.read() if process.stdout else b''
+            remaining_output = remaining_bytes.decode('utf-8', errors='replace')
             
             # 写入输出到日志文件
-            if remaining_output:
-                rotator.write(remaining_output)
+            if remaining_bytes:
+                rotator.write(remaining_bytes)
             
             # 写入结束标记
             error_msg = f"进程启动后立即退出，退出码: {exit_code}"
-            rotator.write(f"\n[错误] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
+            rotator.write_text(f"\n[错误] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
             if remaining_output:
-                rotator.write(f"[输出内容]\n{remaining_output}\n")
+                rotator.write_text(f"[输出内容]\n{remaining_output}\n")
             rotator.close()
             
             print(f"ERROR: {error_msg}", file=sys.stderr)
@@ -510,33 +897,76 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
             print(f"LOG_FILE_PATH:{rotator.get_current_log_path()}", file=sys.stderr)
             sys.exit(exit_code if exit_code is not None else 1)
         
-        # 实时读取进程输出并写入日志
-        while True:
-            # 检查进程是否结束
-            if process.poll() is not None:
-                # 读取剩余输出
-                remaining_output = process.stdout.read()
-                if remaining_output:
-                    rotator.write(remaining_output)
-                break
-            
-            # 读取一行输出（非阻塞）
-            line = process.stdout.readline()
-            if line:
-                rotator.write(line)
-            else:
-                # 没有输出时短暂休眠
-                time.sleep(0.1)
+        # 实时读取进程输出并原样写入日志（不解码，保留进程输出的原始编码）：
+        # 按块读取管道，有数据即返回，读到EOF表示输出结束
+        # （直通模式下子进程直接写日志文件，这里只需等待进程结束）
+        # deadline：收到停止信号后等待子进程退出、读完剩余输出的截止时间
+        deadline = None
+        if process.stdout is not None:
+            stdout_fd = process.stdout.fileno()
+            # 用selector等待管道可读（有数据立即唤醒）；Windows的管道不支持select，直接阻塞读取
+            selector = None
+            if sys.platform != 'win32':
+                selector = selectors.DefaultSelector()
+                selector.register(stdout_fd, selectors.EVENT_READ)
+            # Linux上优先用splice把管道数据直接移入日志文件，不经过Python复制
+            # 已提交的数据未能全部写入时不使用splice，避免splice写入的数据排到它们前面
+            use_splice = hasattr(os, 'splice') and sys.platform.startswith('linux') and rotator.sync()
+            try:
+                while True:
+                    timeout = READ_POLL_INTERVAL
+                    if deadline is None and rotator.shutdown_requested():
+                        # 收到停止信号：终止子进程，在限定时间内读完剩余输出
+                        _terminate_child(process)
+                        deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+                    if deadline is not None:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        timeout = min(timeout, READ_POLL_INTERVAL)
+                    if selector is not None and not selector.select(timeout=timeout):
+                        # 超时无数据：进程已退出则结束读取，否则继续等待
+                        if process.poll() is not None:
+                            break
+                        continue
+                    if use_splice:
+                        try:
+                            moved = rotator.splice(stdout_fd)
+                        except OSError as e:
+                            # 文件系统不支持splice等情况，回退到普通读写
+                            print(f"DEBUG: splice failed ({str(e)}), falling back to read/write", file=sys.stderr)
+                            use_splice = False
+                            continue
+                        if not moved:
+                            break
+                        continue
+                    block = os.read(stdout_fd, READ_BLOCK_SIZE)
+                    if not block:
+                        break
+                    rotator.write(block)
+            finally:
+                if selector is not None:
+                    selector.close()
         
-        # 等待进程结束
-        exit_code = process.wait()
+        # 等待进程结束（直通模式下也在这里响应停止信号）
+        exit_code = _wait_for_exit(process, rotator, deadline)
+        
+        if rotator.shutdown_requested():
+            # 收到停止信号，子进程已终止
+            try:
+                rotator.write_text(f"\n[任务停止] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 收到停止信号，进程已终止，退出码: {exit_code}\n")
+            except:
+                pass
+            rotator.close()
+            print(f"LOG_FILE_PATH:{rotator.get_current_log_path()}", file=sys.stderr)
+            sys.exit(0)
         
         # 写入结束标记
         try:
             if exit_code == 0:
-                rotator.write(f"\n[任务结束] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 退出码: {exit_code} (成功)\n")
+                rotator.write_text(f"\n[任务结束] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 退出码: {exit_code} (成功)\n")
             else:
-                rotator.write(f"\n[任务结束] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 退出码: {exit_code} (失败)\n")
+                rotator.write_text(f"\n[任务结束] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 退出码: {exit_code} (失败)\n")
         except:
             pass
         
@@ -552,9 +982,8 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
         # 记录错误到日志文件
         error_msg = f"执行任务时发生异常: {str(e)}"
         try:
-            rotator.write(f"\n[异常] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
-            import traceback
-            rotator.write(f"[异常堆栈]\n{traceback.format_exc()}\n")
+            rotator.write_text(f"\n[异常] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {error_msg}\n")
+            rotator.write_text(f"[异常堆栈]\n{traceback.format_exc()}\n")
             rotator.close()
         except:
             pass
@@ -566,7 +995,6 @@ def run_command_with_log_rotation(command: str, log_dir: str, task_id: int, task
             pass
         
         print(f"ERROR: {error_msg}", file=sys.stderr)
-        import traceback
         print(traceback.format_exc(), file=sys.stderr)
         print(f"LOG_FILE_PATH:{rotator.get_current_log_path()}", file=sys.stderr)
         sys.exit(1)
@@ -594,7 +1022,6 @@ if __name__ == "__main__":
         run_command_with_log_rotation(command, log_dir, task_id, task_name)
     except Exception as e:
         print(f"FATAL ERROR: {str(e)}", file=sys.stderr)
-        import traceback
         print(traceback.format_exc(), file=sys.stderr)
         sys.exit(1)
 
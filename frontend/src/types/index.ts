@@ -88,6 +88,8 @@ export interface TaskLog {
   log_file_path: string
   start_time: string
   end_time?: string
+  log_date?: string
+  part_num?: number
   created_at: string
 }
 